@@ -15,11 +15,14 @@
 # You should have received a copy of the GNU General Public License
 # along with repology.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, Iterable, List
 
 from apis.wikidata import WikidataApi
 
+from utils.metrics import metrics
+
 
 @dataclass
 class Action:
@@ -33,6 +36,8 @@ class AddPropertyAction(Action):
     prop: str
     value: str
     url: str
+    # revision of the item the action was computed against, 0 if unknown
+    baserevid: int = 0
 
 
 @dataclass
@@ -62,15 +67,84 @@ class MultipleItemsAction(Action):
     pass
 
 
+@dataclass
+class MissingItemAction(Action):
+    pass
+
+
+@dataclass
+class DuplicateValueAction(Action):
+    repo: str
+    prop: str
+    value: str
+    url: str
+    other_items: List[str]
+
+
+def group_actions_by_item(actions: Iterable[Action]) -> List[List[Action]]:
+    """Group actions by item, preserving order of items and actions."""
+    actions_by_item: Dict[str, List[Action]] = defaultdict(list)
+
+    for action in actions:
+        actions_by_item[action.item].append(action)
+
+    return list(actions_by_item.values())
+
+
 class ActionPerformer:
     wikidata: WikidataApi
 
     def __init__(self, wikidata: WikidataApi) -> None:
         self.wikidata = wikidata
 
+    def _add_claims(self, actions: List[AddPropertyAction], summary: str) -> None:
+        """Add claims for actions on a single item, re-checking them on edit conflict.
+
+        The edit is based on the revision the actions were computed
+        against, so it fails if the item was changed since. Only then
+        the item is fetched again, and claims which have already been
+        added by someone else are dropped. Actions are not recomputed
+        otherwise, so other changes to the item (e.g. removed values)
+        don't affect what is added.
+        """
+        item = actions[0].item
+        values = [(action.prop, action.value) for action in actions]
+
+        try:
+            self.wikidata.add_claims(item, values, summary, baserevid=actions[0].baserevid)
+        except Exception as e:
+            if not self.wikidata.is_edit_conflict(e):
+                raise
+
+            metrics.inc('edit_conflicts_total')
+
+            self.wikidata.reload([item])
+            values = [(prop, value) for prop, value in values if value not in self.wikidata.get_values(item, prop, allow_deprecated=True)]
+
+            if not values:
+                return
+
+            self.wikidata.add_claims(item, values, summary, baserevid=self.wikidata.get_revisions([item])[item])
+
+        metrics.inc('edits_total')
+        metrics.inc('claims_added_total', len(values))
+
     def perform(self, action: Action) -> None:
         if isinstance(action, AddPropertyAction):
-            self.wikidata.add_claim(action.item, action.prop, action.value, 'adding package information from Repology')
+            self._add_claims([action], 'adding package information from Repology')
+
+    def perform_batch(self, actions: List[Action]) -> None:
+        """Perform actions for a single item, in a single edit if possible."""
+        add_actions = [action for action in actions if isinstance(action, AddPropertyAction)]
+
+        if len(add_actions) == 1:
+            self.perform(add_actions[0])
+        elif add_actions:
+            assert all(action.item == add_actions[0].item for action in add_actions)
+
+            repos = sorted(set(action.repo for action in add_actions))
+
+            self._add_claims(add_actions, 'adding package information from Repology ({})'.format(', '.join(repos)))
 
     def is_performable(self, action: Action) -> bool:
         if isinstance(action, AddPropertyAction):
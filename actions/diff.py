@@ -0,0 +1,132 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+from dataclasses import dataclass
+from typing import Callable, Collection, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from actions import Action, AddPropertyAction, MissingItemAction, MultipleItemsAction, NoValueAction, RemovePropertyAction, TooManyValuesAction
+
+from apis.repology import RepologyProject
+
+
+@dataclass
+class RepologyWikidataMapping:
+    repo: str
+    prop: str
+    field: str
+    url: str
+    histurls: List[str]
+    ignore_missing: bool = False
+
+
+ItemProjects = Tuple[str, List[RepologyProject]]
+
+# (item, prop, allow_deprecated) -> values
+ValuesGetter = Callable[[str, str, bool], FrozenSet[Optional[str]]]
+
+
+def diff_items(groups: List[ItemProjects], mappings: List[RepologyWikidataMapping], get_values: ValuesGetter, max_entries: int, revisions: Optional[Dict[str, int]] = None, missing_items: Collection[str] = ()) -> Dict[str, List[Action]]:
+    """Compare Repology projects to Wikidata claims for a batch of items.
+
+    Actions are returned by item, in order of groups. Additions carry
+    the item revisions from revisions, if given, so edits may later be
+    based on them. Items listed in missing_items don't exist in
+    Wikidata, and are only reported.
+    """
+    if revisions is None:
+        revisions = {}
+
+    actions_by_item: Dict[str, List[Action]] = {}
+
+    for item, projects in groups:
+        actions: List[Action] = []
+        actions_by_item[item] = actions
+
+        projectnames = [project.name for project in projects]
+
+        wikidata_items: Set[str] = set()
+
+        for project in projects:
+            wikidata_items.update(project.values_by_repo_field.get(('wikidata', 'name'), []))
+
+        if len(wikidata_items) > 1:
+            actions.append(MultipleItemsAction(item=item, projectnames=projectnames))
+            continue
+
+        if item in missing_items:
+            actions.append(MissingItemAction(item=item, projectnames=projectnames))
+            continue
+
+        for mapping in mappings:
+            repology_values: Set[Optional[str]] = set()
+
+            for project in projects:
+                repology_values.update(project.values_by_repo_field.get((mapping.repo, mapping.field), []))
+
+            missing = repology_values - get_values(item, mapping.prop, True)
+            extra = get_values(item, mapping.prop, False) - repology_values
+
+            if missing and len(repology_values) > max_entries:
+                actions.append(
+                    TooManyValuesAction(
+                        item=item,
+                        projectnames=projectnames,
+                        repo=mapping.repo,
+                        prop=mapping.prop,
+                        count=len(repology_values)
+                    )
+                )
+                continue
+
+            for mvalue in missing:
+                assert mvalue is not None
+                actions.append(
+                    AddPropertyAction(
+                        item=item,
+                        projectnames=projectnames,
+                        repo=mapping.repo,
+                        prop=mapping.prop,
+                        value=mvalue,
+                        url=mapping.url.format(mvalue),
+                        baserevid=revisions.get(item, 0)
+                    )
+                )
+
+            for evalue in extra:
+                if evalue is None:
+                    actions.append(
+                        NoValueAction(
+                            item=item,
+                            projectnames=projectnames,
+                            repo=mapping.repo,
+                            prop=mapping.prop,
+                        )
+                    )
+                elif not mapping.ignore_missing:
+                    actions.append(
+                        RemovePropertyAction(
+                            item=item,
+                            projectnames=projectnames,
+                            repo=mapping.repo,
+                            prop=mapping.prop,
+                            value=evalue,
+                            url=mapping.url.format(evalue),
+                            histurls=[url.format(evalue) for url in mapping.histurls]
+                        )
+                    )
+
+    return actions_by_item
@@ -0,0 +1,67 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import defaultdict
+from typing import Dict, List, Set
+
+from actions import Action, AddPropertyAction, DuplicateValueAction
+
+from apis.claims import PropertyValueIndex, ValueKey
+
+
+def get_added_values(actions: List[Action]) -> Set[ValueKey]:
+    """Return (property, value) pairs which actions are going to add."""
+    return set((action.prop, action.value) for action in actions if isinstance(action, AddPropertyAction))
+
+
+def flag_duplicate_values(actions: List[Action], index: PropertyValueIndex) -> List[Action]:
+    """Replace additions of values which are not unique with DuplicateValueAction.
+
+    A value is not unique if it's already present on another item
+    according to index, or if it's going to be added to another item
+    as well.
+    """
+    planned_items: Dict[ValueKey, Set[str]] = defaultdict(set)
+
+    for action in actions:
+        if isinstance(action, AddPropertyAction):
+            planned_items[action.prop, action.value].add(action.item)
+
+    result: List[Action] = []
+
+    for action in actions:
+        if isinstance(action, AddPropertyAction):
+            key = (action.prop, action.value)
+            other_items = sorted((planned_items[key] | set(index.get_items(*key))) - {action.item})
+
+            if other_items:
+                result.append(
+                    DuplicateValueAction(
+                        item=action.item,
+                        projectnames=action.projectnames,
+                        repo=action.repo,
+                        prop=action.prop,
+                        value=action.value,
+                        url=action.url,
+                        other_items=other_items
+                    )
+                )
+                continue
+
+        result.append(action)
+
+    return result
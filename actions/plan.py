@@ -0,0 +1,145 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import hashlib
+import json
+import os
+from dataclasses import asdict
+from typing import Any, Dict, IO, List, Set, Tuple, Type
+
+from actions import Action, AddPropertyAction, DuplicateValueAction, MissingItemAction, MultipleItemsAction, NoValueAction, RemovePropertyAction, TooManyValuesAction
+
+
+_PLAN_FORMAT = 2
+
+# Wikidata data the actions in a plan were computed from
+PLAN_SOURCE_API = 'api'
+PLAN_SOURCE_DUMP = 'dump'
+
+_ACTION_CLASSES: Dict[str, Type[Action]] = {
+    cls.__name__: cls
+    for cls in [AddPropertyAction, RemovePropertyAction, NoValueAction, TooManyValuesAction, MultipleItemsAction, DuplicateValueAction, MissingItemAction]
+}
+
+
+def serialize_action(action: Action) -> Dict[str, Any]:
+    return dict(asdict(action), action=type(action).__name__)
+
+
+def deserialize_action(fields: Dict[str, Any]) -> Action:
+    fields = dict(fields)
+    return _ACTION_CLASSES[fields.pop('action')](**fields)
+
+
+def save_plan(path: str, actions: List[Action], source: str) -> None:
+    """Save actions, along with Wikidata source they were computed from, to a gzipped JSON lines plan file."""
+    tmp_path = path + '.tmp'
+
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as plan:
+        plan.write(json.dumps({'format': _PLAN_FORMAT, 'source': source, 'actions': len(actions)}) + '\n')
+
+        for action in actions:
+            plan.write(json.dumps(serialize_action(action), separators=(',', ':')) + '\n')
+
+    os.replace(tmp_path, path)
+
+
+def get_plan_digest(path: str) -> str:
+    """Return digest of plan file contents, identifying a particular plan."""
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as plan:
+        for chunk in iter(lambda: plan.read(65536), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def load_plan(path: str) -> Tuple[List[Action], str]:
+    """Load actions and Wikidata source they were computed from."""
+    actions: List[Action] = []
+
+    with gzip.open(path, 'rt', encoding='utf-8') as plan:
+        header = json.loads(next(plan))
+        if header.get('format') != _PLAN_FORMAT:
+            raise RuntimeError('unsupported plan format in {}'.format(path))
+
+        for line in plan:
+            actions.append(deserialize_action(json.loads(line)))
+
+    if len(actions) != header['actions']:
+        raise RuntimeError('plan {} is truncated'.format(path))
+
+    return actions, header['source']
+
+
+class PlanJournal:
+    """Append-only journal of items for which actions were applied.
+
+    Each item is recorded as soon as its edit is completed, so after
+    a crash applying may be resumed from where it was interrupted.
+    Journal is bound to a plan by its digest, and journal left from
+    another plan (e.g. one saved to the same path by a previous run)
+    is discarded.
+    """
+
+    _path: str
+    _fd: IO[str]
+    done: Set[str]
+
+    def __init__(self, path: str, plan_digest: str) -> None:
+        self._path = path
+        self.done = set()
+        header = 'plan {}\n'.format(plan_digest)
+        incomplete = False
+
+        if os.path.exists(path):
+            with open(path, 'r') as journal:
+                stale = next(journal, None) != header
+
+                for line in journal:
+                    # last line may be incomplete after a crash
+                    incomplete = not line.endswith('\n')
+                    if not incomplete:
+                        self.done.add(line.rstrip('\n'))
+
+            if stale:
+                self.done = set()
+                incomplete = False
+                os.remove(path)
+
+        self._fd = open(path, 'a')
+
+        if self._fd.tell() == 0:
+            self._fd.write(header)
+        elif incomplete:
+            self._fd.write('\n')
+
+    def record(self, item: str) -> None:
+        self._fd.write(item + '\n')
+        self._fd.flush()
+        os.fsync(self._fd.fileno())
+        self.done.add(item)
+
+    def close(self) -> None:
+        self._fd.close()
+
+    def remove(self) -> None:
+        """Close and remove journal, once the plan is applied completely."""
+        self._fd.close()
+        os.remove(self._path)
@@ -0,0 +1,208 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Generic, Iterator, List, Optional, TypeVar
+
+
+T = TypeVar('T')
+
+# rate multiplier applied after each successful write
+_RATE_INCREASE = 1.05
+
+# rate multiplier applied after each write failed due to lag; it's
+# mild, as with concurrent writers several writes fail on each lag
+# spike
+_RATE_DECREASE = 0.75
+
+# default minimal rate, relative to the initial one
+_MIN_RATE_FRACTION = 0.25
+
+
+class TokenBucket:
+    """Token bucket rate limiter with adjustable rate and pausing."""
+
+    _rate: float
+    _capacity: float
+    _tokens: float
+    _updated: float
+    _paused_until: float
+    _lock: threading.Lock
+
+    def __init__(self, rate: float, capacity: float = 1.0) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._rate = rate
+
+    def pause(self, seconds: float) -> None:
+        """Don't give out any tokens for a given time."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._tokens = min(self._capacity, self._tokens + (now - max(self._updated, self._paused_until)) * self._rate)
+                    self._updated = now
+
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+
+                    delay = (1.0 - self._tokens) / self._rate
+
+            time.sleep(delay)
+
+
+@dataclass
+class WriteStats:
+    num_done: int = 0
+    num_throttled: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.num_done / self.seconds if self.seconds > 0 else 0.0
+
+
+class WriteScheduler(Generic[T]):
+    """Performs writes concurrently, adapting to server lag.
+
+    Up to workers writes are kept in flight, while the overall rate is
+    limited by a token bucket. When a write fails with an error which
+    get_retry_delay() recognizes as lag or rate limit related (returning
+    the delay to wait), the rate is decreased, but not below min_rate
+    (a quarter of the initial rate by default), all writes are paused
+    for the delay and the write is retried. Each successful write
+    increases the rate a bit, up to max_rate. Other errors are
+    propagated to the caller after writes in flight are completed.
+    """
+
+    _perform: Callable[[T], None]
+    _get_retry_delay: Callable[[BaseException], Optional[float]]
+    _workers: int
+    _bucket: TokenBucket
+    _min_rate: float
+    _max_rate: float
+    stats: WriteStats
+
+    def __init__(self, perform: Callable[[T], None], get_retry_delay: Callable[[BaseException], Optional[float]], workers: int = 1, rate: float = 1.0, max_rate: float = 5.0, min_rate: Optional[float] = None) -> None:
+        self._perform = perform
+        self._get_retry_delay = get_retry_delay
+        self._workers = max(workers, 1)
+        self._bucket = TokenBucket(rate, capacity=self._workers)
+        self._min_rate = min(min_rate, rate) if min_rate is not None else rate * _MIN_RATE_FRACTION
+        self._max_rate = max(max_rate, rate)
+        self.stats = WriteStats()
+
+    def _adjust_rate(self, success: bool) -> None:
+        if success:
+            self._bucket.set_rate(min(self._max_rate, self._bucket.rate * _RATE_INCREASE))
+        else:
+            self._bucket.set_rate(max(self._min_rate, self._bucket.rate * _RATE_DECREASE))
+
+    def run(self, tasks: List[T]) -> Iterator[T]:
+        """Perform tasks, yielding them as they are completed."""
+        lock = threading.Lock()
+        completed: List[T] = []
+        errors: List[BaseException] = []
+        condition = threading.Condition(lock)
+        pending = iter(tasks)
+        start = time.monotonic()
+
+        def worker() -> None:
+            while True:
+                with lock:
+                    if errors:
+                        return
+                    task = next(pending, None)
+                if task is None:
+                    return
+
+                while True:
+                    self._bucket.acquire()
+
+                    try:
+                        self._perform(task)
+                    except Exception as e:
+                        delay = self._get_retry_delay(e)
+                        if delay is None:
+                            with lock:
+                                errors.append(e)
+                                condition.notify()
+                            return
+
+                        with lock:
+                            self.stats.num_throttled += 1
+                        self._adjust_rate(False)
+                        self._bucket.pause(delay)
+                        continue
+
+                    self._adjust_rate(True)
+                    break
+
+                with lock:
+                    completed.append(task)
+                    self.stats.num_done += 1
+                    self.stats.seconds = time.monotonic() - start
+                    condition.notify()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self._workers)]
+        for thread in threads:
+            thread.start()
+
+        while True:
+            with lock:
+                while not completed and not errors and any(thread.is_alive() for thread in threads):
+                    condition.wait(0.1)
+
+                done, completed = completed, []
+
+            yield from done
+
+            if not any(thread.is_alive() for thread in threads):
+                break
+
+        for thread in threads:
+            thread.join()
+
+        # completions that raced with the last check
+        yield from completed
+
+        self.stats.seconds = time.monotonic() - start
+
+        if errors:
+            raise errors[0]
@@ -0,0 +1,66 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+from actions import Action
+from actions.plan import deserialize_action, serialize_action
+
+
+class StateStore:
+    """Persistent SQLite store of per-item comparison outcomes.
+
+    For each item, a fingerprint of its Repology inputs and the
+    revision of its Wikidata entity are stored along with the actions
+    produced by comparison, so that items with neither of these
+    changed may reuse the outcome of a previous run.
+    """
+
+    _db: sqlite3.Connection
+
+    def __init__(self, path: str) -> None:
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS items (item TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, revision INTEGER NOT NULL, actions TEXT NOT NULL)')
+
+    def get_many(self, items: Iterable[str]) -> Dict[str, Tuple[str, int, List[Action]]]:
+        """Return (fingerprint, revision, actions) for known items among given ones."""
+        items = list(items)
+        result: Dict[str, Tuple[str, int, List[Action]]] = {}
+
+        for start in range(0, len(items), 500):
+            chunk = items[start:start + 500]
+            query = 'SELECT item, fingerprint, revision, actions FROM items WHERE item IN ({})'.format(','.join('?' * len(chunk)))
+            for item, fingerprint, revision, actions in self._db.execute(query, chunk):
+                result[item] = (fingerprint, revision, [deserialize_action(action) for action in json.loads(actions)])
+
+        return result
+
+    def store_many(self, entries: Iterable[Tuple[str, str, int, List[Action]]]) -> None:
+        """Store (item, fingerprint, revision, actions) tuples, replacing older ones."""
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO items (item, fingerprint, revision, actions) VALUES (?, ?, ?, ?)',
+                (
+                    (item, fingerprint, revision, json.dumps([serialize_action(action) for action in actions], separators=(',', ':')))
+                    for item, fingerprint, revision, actions in entries
+                )
+            )
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,169 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+
+from utils.metrics import metrics
+
+
+class PageCacheMiss(RuntimeError):
+    pass
+
+
+class PageCache:
+    """On-disk cache of HTTP responses keyed by URL.
+
+    Entries younger than ttl seconds are served as is, older ones are
+    revalidated with If-None-Match/If-Modified-Since. In offline mode
+    everything is served from cache regardless of age, and missing
+    entries are errors.
+    """
+
+    _path: str
+    _ttl: float
+    _offline: bool
+
+    def __init__(self, path: str, ttl: float = 3600, offline: bool = False) -> None:
+        self._path = path
+        self._ttl = ttl
+        self._offline = offline
+
+        os.makedirs(path, exist_ok=True)
+
+    def _get_entry_path(self, url: str) -> str:
+        return os.path.join(self._path, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def _load(self, url: str) -> Optional[Dict[str, Any]]:
+        path = self._get_entry_path(url)
+
+        try:
+            with open(path + '.meta', 'r') as meta_fd:
+                meta: Dict[str, Any] = json.load(meta_fd)
+            with open(path + '.body', 'rb') as body_fd:
+                meta['body'] = body_fd.read()
+        except (OSError, ValueError):
+            return None
+
+        return meta if meta.get('url') == url else None
+
+    def _store(self, url: str, body: bytes, meta: Dict[str, Any]) -> None:
+        path = self._get_entry_path(url)
+
+        # write to temporary files and rename, so concurrent readers
+        # and interrupted runs never see partial entries
+        with open(path + '.body.tmp', 'wb') as body_fd:
+            body_fd.write(body)
+        os.replace(path + '.body.tmp', path + '.body')
+
+        self._store_meta(url, meta)
+
+    def _store_meta(self, url: str, meta: Dict[str, Any]) -> None:
+        path = self._get_entry_path(url)
+
+        with open(path + '.meta.tmp', 'w') as meta_fd:
+            json.dump(dict(meta, url=url), meta_fd)
+        os.replace(path + '.meta.tmp', path + '.meta')
+
+    def get(self, url: str, fetch: Callable[[Dict[str, str]], requests.Response]) -> bytes:
+        """Return response body for url, calling fetch with extra request headers if needed."""
+        entry = self._load(url)
+        now = time.time()
+
+        if entry is not None and (self._offline or now - entry['time'] < self._ttl):
+            metrics.inc('cache_requests_total', cache='pages', result='hit')
+            return bytes(entry['body'])
+
+        if self._offline:
+            raise PageCacheMiss('{} is not cached, cannot fetch it in offline mode'.format(url))
+
+        headers = {}
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        response = fetch(headers)
+
+        if entry is not None and response.status_code == 304:
+            metrics.inc('cache_requests_total', cache='pages', result='revalidated')
+            body = bytes(entry.pop('body'))
+            self._store_meta(url, dict(entry, time=now))
+            return body
+
+        response.raise_for_status()
+
+        metrics.inc('cache_requests_total', cache='pages', result='miss')
+
+        meta = {
+            'time': now,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        self._store(url, response.content, meta)
+
+        return response.content
+
+
+class EntityCache:
+    """Persistent SQLite store of Wikidata entities keyed by item id.
+
+    Along with entity data, revision id is stored for each entity,
+    so it can later be checked whether the cached copy is up to date.
+    """
+
+    _db: sqlite3.Connection
+
+    def __init__(self, path: str) -> None:
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS entities (item TEXT PRIMARY KEY, lastrevid INTEGER NOT NULL, data TEXT NOT NULL)')
+
+    def get_many(self, items: Iterable[str]) -> Dict[str, Tuple[int, Any]]:
+        """Return (lastrevid, data) for cached items among given ones."""
+        items = list(items)
+        result: Dict[str, Tuple[int, Any]] = {}
+
+        # stay below SQLite's default limit on number of query parameters
+        for start in range(0, len(items), 500):
+            chunk = items[start:start + 500]
+            query = 'SELECT item, lastrevid, data FROM entities WHERE item IN ({})'.format(','.join('?' * len(chunk)))
+            for item, lastrevid, data in self._db.execute(query, chunk):
+                result[item] = (lastrevid, json.loads(data))
+
+        return result
+
+    def store_many(self, entries: Iterable[Tuple[str, int, Any]]) -> None:
+        """Store (item, lastrevid, data) tuples, replacing older ones."""
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO entities (item, lastrevid, data) VALUES (?, ?, ?)',
+                ((item, lastrevid, json.dumps(data, separators=(',', ':'))) for item, lastrevid, data in entries)
+            )
+
+    def iterate(self) -> Iterator[Tuple[str, int, Any]]:
+        """Iterate (item, lastrevid, data) for all cached entities."""
+        for item, lastrevid, data in self._db.execute('SELECT item, lastrevid, data FROM entities'):
+            yield item, lastrevid, json.loads(data)
+
+    def close(self) -> None:
+        self._db.close()
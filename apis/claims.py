@@ -0,0 +1,111 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Any, Collection, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+# compact claim representation: (value, deprecated, expired)
+Claim = Tuple[Optional[str], bool, bool]
+
+
+def compact_claims(claims: Dict[str, Any], props: Collection[str]) -> Dict[str, List[Claim]]:
+    """Convert claims JSON into compact representation, keeping only given properties."""
+    result = {}
+
+    for prop in props:
+        if prop in claims:
+            result[prop] = [
+                (
+                    str(claim['mainsnak']['datavalue']['value']) if claim['mainsnak']['snaktype'] == 'value' else None,
+                    claim['rank'] == 'deprecated',
+                    'P582' in claim.get('qualifiers', {}),
+                )
+                for claim in claims[prop]
+            ]
+
+    return result
+
+
+class PropertyClaims:
+    """Value sets of claims of an item for a single property."""
+
+    __slots__ = ['current_values', 'all_values']
+
+    current_values: FrozenSet[Optional[str]]
+    all_values: FrozenSet[Optional[str]]
+
+    def __init__(self, claims: List[Claim]) -> None:
+        self.all_values = frozenset(value for value, _, _ in claims)
+
+        # most claims are current, in which case value sets are the same
+        if any(deprecated or expired for _, deprecated, expired in claims):
+            self.current_values = frozenset(value for value, deprecated, expired in claims if not (deprecated or expired))
+        else:
+            self.current_values = self.all_values
+
+
+# claims of an item by property
+ClaimIndex = Dict[str, PropertyClaims]
+
+
+def index_claims(claims: Dict[str, Any], props: Optional[Collection[str]] = None) -> ClaimIndex:
+    """Convert claims JSON into claim index, keeping only given properties (all if None)."""
+    return {
+        prop: PropertyClaims(prop_claims)
+        for prop, prop_claims in compact_claims(claims, claims.keys() if props is None else props).items()
+    }
+
+
+# (property, value)
+ValueKey = Tuple[str, str]
+
+
+class PropertyValueIndex:
+    """Reverse index of claims: items having each (property, value).
+
+    Deprecated claims are not indexed. If keys are given, only these
+    are kept, so the index stays small when filled from a full dump.
+    """
+
+    _items: Dict[ValueKey, List[str]]
+    _keys: Optional[Set[ValueKey]]
+
+    def __init__(self, keys: Optional[Iterable[ValueKey]] = None) -> None:
+        self._items = {}
+        self._keys = set(keys) if keys is not None else None
+
+    def add(self, item: str, prop: str, value: str) -> None:
+        key = (prop, value)
+
+        if self._keys is not None and key not in self._keys:
+            return
+
+        items = self._items.setdefault(key, [])
+        if item not in items:
+            items.append(item)
+
+    def add_claims(self, item: str, claims: Dict[str, List[Claim]]) -> None:
+        for prop, prop_claims in claims.items():
+            for value, deprecated, _ in prop_claims:
+                if value is not None and not deprecated:
+                    self.add(item, prop, value)
+
+    def get_items(self, prop: str, value: str) -> List[str]:
+        return self._items.get((prop, value), [])
+
+    def __len__(self) -> int:
+        return len(self._items)
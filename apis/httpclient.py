@@ -0,0 +1,177 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import metrics
+
+
+# statuses worth retrying, as these are likely transient
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class HttpStats:
+    num_requests: int = 0
+    num_retries: int = 0
+    num_bytes: int = 0
+    seconds: float = 0.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """HTTP client with connection pooling and retries.
+
+    Connections are kept alive and reused between requests, and
+    compressed responses are negotiated. Failed requests (connection
+    errors, timeouts and statuses from _RETRY_STATUSES) are retried
+    with jittered exponential backoff, honoring Retry-After. Request
+    counts, bytes received and time spent are accumulated in stats,
+    and also reported to metrics under given name.
+    """
+
+    _session: requests.Session
+    _timeout: Union[float, Tuple[float, float]]
+    _retries: int
+    _backoff: float
+    _max_backoff: float
+    _name: str
+    _lock: threading.Lock
+    stats: HttpStats
+
+    def __init__(self, user_agent: str, timeout: Union[float, Tuple[float, float]] = 60, retries: int = 5, backoff: float = 1.0, max_backoff: float = 300.0, pool_size: int = 10, name: str = 'http') -> None:
+        self._session = requests.Session()
+        self._session.headers['User-agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._name = name
+        self._lock = threading.Lock()
+        self.stats = HttpStats()
+
+    def _account(self, num_requests: int = 0, num_retries: int = 0, num_bytes: int = 0, seconds: float = 0.0) -> None:
+        with self._lock:
+            self.stats.num_requests += num_requests
+            self.stats.num_retries += num_retries
+            self.stats.num_bytes += num_bytes
+            self.stats.seconds += seconds
+
+        if num_requests:
+            metrics.inc('http_requests_total', num_requests, api=self._name)
+            metrics.observe('http_request_duration_seconds', seconds, api=self._name)
+        if num_retries:
+            metrics.inc('http_retries_total', num_retries, api=self._name)
+        if num_bytes:
+            metrics.inc('http_received_bytes_total', num_bytes, api=self._name)
+
+    def _get_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self._max_backoff)
+
+        # full jitter
+        return random.uniform(0, min(self._backoff * 2 ** attempt, self._max_backoff))
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, params: Optional[Dict[str, str]] = None, stream: bool = False) -> requests.Response:
+        """Perform GET request, retrying on transient failures.
+
+        Unless stream is specified, the body is read before returning.
+        """
+        attempt = 0
+
+        while True:
+            start = time.monotonic()
+            retry_after: Optional[float] = None
+
+            try:
+                response = self._session.get(url, headers=headers, params=params, timeout=self._timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                self._account(num_requests=1, seconds=time.monotonic() - start)
+                if attempt >= self._retries:
+                    raise
+            else:
+                if response.status_code not in _RETRY_STATUSES or attempt >= self._retries:
+                    self._account(num_requests=1, num_bytes=0 if stream else len(response.content), seconds=time.monotonic() - start)
+                    return response
+
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                response.close()
+                self._account(num_requests=1, seconds=time.monotonic() - start)
+
+            self._account(num_retries=1)
+            time.sleep(self._get_delay(attempt, retry_after))
+            attempt += 1
+
+    def wait_retry(self, attempt: int) -> bool:
+        """Wait before retrying a request which failed after get() has returned, e.g. while reading its body.
+
+        Returns False without waiting if there are no retries left.
+        """
+        if attempt >= self._retries:
+            return False
+
+        self._account(num_retries=1)
+        time.sleep(self._get_delay(attempt))
+        return True
+
+    def iter_content(self, url: str, headers: Optional[Dict[str, str]] = None, chunk_size: int = 65536) -> Iterator[bytes]:
+        """Perform streaming GET request, yielding chunks of response body.
+
+        Only the request is retried, while failures of reading the body
+        are left to the caller, which may retry with wait_retry().
+        """
+        with self.get(url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+
+            chunks = response.iter_content(chunk_size)
+
+            while True:
+                # only account time spent on receiving, not on processing by the caller
+                start = time.monotonic()
+                chunk = next(chunks, None)
+                self._account(num_bytes=len(chunk) if chunk else 0, seconds=time.monotonic() - start)
+
+                if chunk is None:
+                    return
+
+                yield chunk
@@ -15,15 +15,30 @@
 # You should have received a copy of the GNU General Public License
 # along with repology.  If not, see <http://www.gnu.org/licenses/>.
 
-from collections import defaultdict
+import sys
 from dataclasses import dataclass
-from typing import Any, Dict, Iterable, List, MutableSet, Optional, Tuple
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from apis.cache import PageCache
+from apis.httpclient import HttpClient
 
 import requests
 
+from utils.jsonstream import iterate_json_object
+from utils.prefetch import prefetchify
+
 
 _USER_AGENT = 'repology-wiki-bot/0.0.1'
 
+# number of projects Repology API returns per page
+_PAGE_SIZE = 200
+
+_CHUNK_SIZE = 65536
+
+# errors of reading a page body, such as dropped connection or
+# truncated JSON, which are worth fetching the page again
+_PAGE_READ_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, ValueError)
+
 
 @dataclass
 class _RepologyProjectPackages:
@@ -31,50 +46,199 @@ class _RepologyProjectPackages:
     packages: List[Dict[str, Any]]
 
 
-@dataclass
+RepoField = Tuple[str, str]
+
+
 class RepologyProject:
+    """Repology project along with package names by (repository, field)."""
+
+    __slots__ = ['name', 'values_by_repo_field']
+
     name: str
-    values_by_repo_field: Dict[Tuple[str, str], MutableSet[str]]
+    values_by_repo_field: Dict[RepoField, Tuple[str, ...]]
+
+    def __init__(self, name: str, values_by_repo_field: Dict[RepoField, Tuple[str, ...]]) -> None:
+        self.name = name
+        self.values_by_repo_field = values_by_repo_field
+
+    def __getstate__(self) -> Tuple[str, Dict[RepoField, Tuple[str, ...]]]:
+        return self.name, self.values_by_repo_field
+
+    def __setstate__(self, state: Tuple[str, Dict[RepoField, Tuple[str, ...]]]) -> None:
+        self.name, self.values_by_repo_field = state
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, RepologyProject) and self.name == other.name and self.values_by_repo_field == other.values_by_repo_field
+
+    def __repr__(self) -> str:
+        return 'RepologyProject(name={!r}, values_by_repo_field={!r})'.format(self.name, self.values_by_repo_field)
+
+
+def _iterate_page_chunks(url: str, client: HttpClient, cache: Optional[PageCache] = None) -> Iterator[bytes]:
+    if cache is None:
+        yield from client.iter_content(url, chunk_size=_CHUNK_SIZE)
+        return
+
+    def fetch(headers: Dict[str, str]) -> requests.Response:
+        return client.get(url, headers=headers)
+
+    yield cache.get(url, fetch)
+
+
+def create_repology_client(timeout: float = 60, retries: int = 5, pool_size: int = 10) -> HttpClient:
+    return HttpClient(_USER_AGENT, timeout=timeout, retries=retries, pool_size=pool_size, name='repology')
+
+
+def _iterate_repology_range(apiurl: str, begin_name: Optional[str] = None, end_name: Optional[str] = None, stop_name: Optional[str] = None, inrepo: str = 'wikidata', client: Optional[HttpClient] = None, cache: Optional[PageCache] = None, repos: Optional[Collection[str]] = None) -> Iterator[_RepologyProjectPackages]:
+    """Iterate repology projects in a given range, page by page.
 
+    Pages are decoded incrementally, so projects are produced as soon
+    as they are received, and packages from repositories other than
+    repos are dropped without being accumulated.
+    """
+    package_filter = None if repos is None else lambda package: bool(package['repo'] in repos)
 
-def _iterate_repology_project_packages(apiurl: str, begin_name: Optional[str] = None, end_name: Optional[str] = None, inrepo: str = 'wikidata') -> Iterable[_RepologyProjectPackages]:
-    """Iterate all repology projects present in a given repository."""
-    headers = {'User-agent': _USER_AGENT}
+    if client is None:
+        client = create_repology_client()
 
     pivot = begin_name
+    first = True
 
     while True:
         if pivot is None:
             # fetching first page
-            data = requests.get('{}?inrepo={}'.format(apiurl, inrepo), headers=headers, timeout=60).json()
-            if len(data) == 0:
-                break
+            url = '{}?inrepo={}'.format(apiurl, inrepo)
         else:
             # fetching subsequent page
-            data = requests.get('{}{}/?inrepo={}'.format(apiurl, pivot, inrepo), headers=headers, timeout=60).json()
-            if len(data) <= 1:
+            url = '{}{}/?inrepo={}'.format(apiurl, pivot, inrepo)
+
+        num_projects = 0
+        max_name = pivot
+
+        # if reading a page fails midway, it's fetched again, skipping
+        # projects which were already produced from it
+        seen_names: Set[str] = set()
+        attempt = 0
+
+        while True:
+            try:
+                for name, packages in iterate_json_object(_iterate_page_chunks(url, client, cache), package_filter):
+                    if name in seen_names:
+                        continue
+                    seen_names.add(name)
+
+                    num_projects += 1
+                    if max_name is None or name > max_name:
+                        max_name = name
+
+                    if name != begin_name and name == pivot:
+                        continue
+
+                    if end_name is not None and name > end_name:
+                        return
+                    if stop_name is not None and name >= stop_name:
+                        return
+
+                    yield _RepologyProjectPackages(name, packages)
+            except _PAGE_READ_ERRORS:
+                if not client.wait_retry(attempt):
+                    raise
+                attempt += 1
+            else:
                 break
 
-        # iterate all packages got from Repology and group by repository
-        for name, packages in data.items():
-            if name != begin_name and name == pivot:
-                continue
+        # subsequent pages start with pivot project which was already
+        # seen, unless it's the first one
+        if num_projects <= (0 if first else 1):
+            return
+
+        pivot = max_name
+        first = False
+
+
+def _iterate_repology_project_packages(apiurl: str, begin_name: Optional[str] = None, end_name: Optional[str] = None, stop_name: Optional[str] = None, inrepo: str = 'wikidata', prefetch: int = 1, client: Optional[HttpClient] = None, cache: Optional[PageCache] = None, repos: Optional[Collection[str]] = None) -> Iterable[_RepologyProjectPackages]:
+    """Iterate all repology projects present in a given repository.
+
+    Projects in [begin_name, end_name] range are returned; stop_name
+    may be used to specify exclusive upper bound instead. Up to
+    prefetch pages worth of projects are fetched in background while
+    the current ones are being processed. Pages are fetched with client
+    (which may be shared between concurrent iterations), and through
+    cache if it's specified.
+    """
+    yield from prefetchify(_iterate_repology_range(apiurl, begin_name, end_name, stop_name, inrepo, client, cache, repos), prefetch * _PAGE_SIZE)
+
+
+_SHARD_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def split_repology_name_range(begin_name: Optional[str], end_name: Optional[str], count: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Split project name range into up to count adjacent subranges.
+
+    Subranges are split at name prefix boundaries and returned as
+    (begin_name, stop_name) pairs suitable for passing to
+    iterate_repology_projects(); stop_name is exclusive and is None
+    for the last subrange, which extends up to end_name.
+    """
+    prefixes = list(_SHARD_ALPHABET)
+    if count > len(prefixes):
+        prefixes = sorted(prefixes + [a + b for a in _SHARD_ALPHABET for b in _SHARD_ALPHABET])
+
+    candidates = [
+        prefix for prefix in prefixes
+        if (begin_name is None or prefix > begin_name) and (end_name is None or prefix <= end_name)
+    ]
 
-            if end_name is not None and name > end_name:
-                return
+    boundaries: List[Optional[str]] = []
 
-            yield _RepologyProjectPackages(name, packages)
+    if candidates:
+        step = len(candidates) / count
+        boundaries.extend(sorted(set(candidates[int(step * i)] for i in range(1, count))))
 
-        pivot = max(data.keys())
+    return list(zip([begin_name] + boundaries, boundaries + [None]))
 
 
-def iterate_repology_projects(apiurl: str, begin_name: Optional[str] = None, end_name: Optional[str] = None) -> Iterable[RepologyProject]:
-    for project in _iterate_repology_project_packages(apiurl, begin_name, end_name):
-        values_by_repo_field: Dict[Tuple[str, str], MutableSet[str]] = defaultdict(set)
+_FIELDS = ['name', 'srcname', 'binname']
+
+
+def iterate_repology_projects(apiurl: str, begin_name: Optional[str] = None, end_name: Optional[str] = None, stop_name: Optional[str] = None, prefetch: int = 1, client: Optional[HttpClient] = None, cache: Optional[PageCache] = None, fields: Optional[Collection[RepoField]] = None) -> Iterable[RepologyProject]:
+    """Iterate repology projects with package names by (repository, field).
+
+    If fields are specified, only these (repository, field) pairs are
+    kept, and everything else is discarded while parsing. Keys and
+    values are shared between projects to reduce memory footprint.
+    """
+    keys: Dict[RepoField, RepoField] = {}
+
+    if fields is not None:
+        for repo, field in fields:
+            repo_field = (sys.intern(repo), sys.intern(field))
+            keys[repo_field] = repo_field
+
+    repos = set(repo for repo, _ in keys) if fields is not None else None
+
+    for project in _iterate_repology_project_packages(apiurl, begin_name, end_name, stop_name, prefetch=prefetch, client=client, cache=cache, repos=repos):
+        values_by_repo_field: Dict[RepoField, Set[str]] = {}
 
         for package in project.packages:
-            for field in ['name', 'srcname', 'binname']:
-                if field in package:
-                    values_by_repo_field[package['repo'], field].add(package[field])
+            repo = package['repo']
+
+            if repos is not None and repo not in repos:
+                continue
+
+            for field in _FIELDS:
+                if field not in package:
+                    continue
+
+                key = keys.get((repo, field))
+                if key is None:
+                    if fields is not None:
+                        continue
+                    key = keys[repo, field] = (sys.intern(repo), field)
+
+                values_by_repo_field.setdefault(key, set()).add(sys.intern(package[field]))
 
-        yield RepologyProject(project.name, values_by_repo_field)
+        yield RepologyProject(
+            sys.intern(project.name),
+            {key: tuple(sorted(values)) for key, values in values_by_repo_field.items()}
+        )
@@ -0,0 +1,53 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Iterator, Optional, Tuple
+
+from apis.httpclient import HttpClient
+
+
+_USER_AGENT = 'repology-wiki-bot/0.0.1'
+
+_ENTITY_URI_PREFIX = 'http://www.wikidata.org/entity/'
+
+# values of all statements but deprecated ones, like PropertyValueIndex
+# indexes (truthy wdt: values would also miss normal rank statements on
+# items which have preferred ones)
+_PROPERTY_VALUES_QUERY = 'SELECT ?item ?value WHERE {{ ?item p:{0} ?statement . ?statement ps:{0} ?value ; wikibase:rank ?rank . FILTER(?rank != wikibase:DeprecatedRank) }}'
+
+
+def create_sparql_client(timeout: float = 300, retries: int = 5) -> HttpClient:
+    return HttpClient(_USER_AGENT, timeout=timeout, retries=retries, name='sparql')
+
+
+def iterate_property_values(endpoint: str, prop: str, client: Optional[HttpClient] = None) -> Iterator[Tuple[str, str]]:
+    """Iterate (item, value) pairs of all items having given property.
+
+    All values of the property are retrieved with a single query to
+    SPARQL endpoint, such as Wikidata Query Service.
+    """
+    if client is None:
+        client = create_sparql_client()
+
+    response = client.get(endpoint, headers={'Accept': 'application/sparql-results+json'}, params={'query': _PROPERTY_VALUES_QUERY.format(prop)})
+    response.raise_for_status()
+
+    for binding in response.json()['results']['bindings']:
+        item = binding['item']['value']
+
+        if item.startswith(_ENTITY_URI_PREFIX):
+            yield item[len(_ENTITY_URI_PREFIX):], binding['value']['value']
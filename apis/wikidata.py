@@ -15,50 +15,322 @@
 # You should have received a copy of the GNU General Public License
 # along with repology.  If not, see <http://www.gnu.org/licenses/>.
 
-from typing import Any, Iterable, Optional
+import threading
+import time
+from typing import Any, Collection, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
 
-import pywikibot
+from apis.cache import EntityCache
+from apis.claims import ClaimIndex, index_claims
+from apis.httpclient import HttpClient, parse_retry_after
+
+import requests
+
+from utils.metrics import metrics
+
+
+_USER_AGENT = 'repology-wiki-bot/0.0.1'
+
+# maximal number of entities wbgetentities accepts in a single request
+_BATCH_SIZE = 50
+
+# same as pywikibot uses for writes
+_MAXLAG = 5
+
+# number of times a read is retried after maxlag error or garbled response
+_READ_RETRIES = 20
+
+# delay before retrying such read, if the server does not suggest one
+_READ_RETRY_DELAY = 5.0
 
 
 class WikidataApi:
-    _site: Any
+    """Access to Wikidata.
+
+    Reads are performed anonymously through the action API with plain
+    HTTP requests, retried on transient failures and on server lag.
+    Claims of each fetched entity are decoded once into
+    a claim index, which only keeps given properties (all if not
+    specified), so repeated lookups don't touch raw JSON.
+
+    pywikibot, which is only needed for writes, is imported and logged
+    in lazily on the first write, so runs which never write neither
+    pay for its startup nor need its configuration.
+    """
+
     _repo: Any
-    _cache_item: str
-    _cache_page: Any
+    _repo_lock: threading.Lock
+    _apiurl: str
+    _client: HttpClient
+    _cache: Optional[EntityCache]
+    _props: Optional[List[str]]
+    _entities: Dict[str, Tuple[int, ClaimIndex]]
+    _missing: Set[str]
+
+    def __init__(self, apiurl: str = 'https://www.wikidata.org/w/api.php', cache: Optional[EntityCache] = None, props: Optional[Collection[str]] = None, client: Optional[HttpClient] = None) -> None:
+        self._repo = None
+        self._repo_lock = threading.Lock()
+        self._apiurl = apiurl
+        self._client = client if client is not None else HttpClient(_USER_AGENT, retries=_READ_RETRIES, name='wikidata')
+        self._cache = cache
+        self._props = list(props) if props is not None else None
+        self._entities = {}
+        self._missing = set()
+
+    def _query_entities(self, items: List[str], props: str) -> Dict[str, Any]:
+        params = {
+            'action': 'wbgetentities',
+            'ids': '|'.join(items),
+            'props': props,
+            'maxlag': str(_MAXLAG),
+            'format': 'json',
+        }
+
+        attempt = 0
+
+        while True:
+            # connection errors and 5xx statuses are retried by the client
+            response = self._client.get(self._apiurl, params=params)
+            response.raise_for_status()
+
+            try:
+                data = response.json()
+            except ValueError:
+                # e.g. an error page from a proxy
+                error = 'response is not JSON'
+            else:
+                if 'error' not in data:
+                    return data['entities']  # type: ignore
+
+                if data['error'].get('code') != 'maxlag':
+                    raise RuntimeError('wbgetentities failed: {}'.format(data['error'].get('info', data['error'])))
+
+                error = data['error'].get('info', 'maxlag')
+
+            if attempt >= _READ_RETRIES:
+                raise RuntimeError('wbgetentities failed after {} retries: {}'.format(attempt, error))
+
+            metrics.inc('http_retries_total', api='wikidata')
+
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+            time.sleep(delay if delay is not None else _READ_RETRY_DELAY)
+            attempt += 1
+
+    def _load_entities(self, items: List[str]) -> Dict[str, Any]:
+        """Fetch and index given entities, return ones which exist."""
+        entities = self._query_entities(items, 'info|claims')
+        existing = {}
+
+        for item in items:
+            entity = entities.get(item, {})
+
+            # deleted items which are still linked from Repology are
+            # missing, and for merged ones (redirects) the target entity
+            # is returned; in both cases the item should not be touched
+            if 'missing' in entity or entity.get('id', item) != item:
+                self._entities[item] = (0, {})
+                self._missing.add(item)
+            else:
+                self._entities[item] = (entity.get('lastrevid', 0), index_claims(entity.get('claims', {}), self._props))
+                self._missing.discard(item)
+                existing[item] = entity
+
+        return existing
+
+    def _fetch_entities(self, items: List[str]) -> None:
+        entities = self._load_entities(items)
+
+        fetched = []
+
+        for item, entity in entities.items():
+            # missing and redirected entities are not cached
+            if 'lastrevid' in entity:
+                fetched.append((item, entity['lastrevid'], entity.get('claims', {})))
+
+        if self._cache is not None:
+            self._cache.store_many(fetched)
+
+    def _load_cached_entities(self, items: List[str]) -> List[str]:
+        """Load entities which are up to date in cache, return items which need to be fetched."""
+        assert self._cache is not None
+
+        cached = self._cache.get_many(items)
+        if not cached:
+            metrics.inc('cache_requests_total', len(items), cache='entities', result='miss')
+            return items
+
+        # info-only query is cheap compared to fetching full entities
+        entities = self._query_entities(list(cached.keys()), 'info')
+
+        stale = []
+
+        for item in items:
+            entity = entities.get(item, {})
+            if item in cached and cached[item][0] == entity.get('lastrevid') and entity.get('id') == item:
+                self._entities[item] = (cached[item][0], index_claims(cached[item][1], self._props))
+            else:
+                stale.append(item)
+
+        metrics.inc('cache_requests_total', len(items) - len(stale), cache='entities', result='hit')
+        metrics.inc('cache_requests_total', len(stale), cache='entities', result='miss')
+
+        return stale
+
+    def prefetch(self, items: Iterable[str]) -> None:
+        """Load entities for given items in batches, to be used by get_values().
+
+        If entity cache is used, only entities changed since they were
+        cached are fetched.
+        """
+        batch: List[str] = []
+        pending: List[str] = []
+
+        def flush(size: int) -> None:
+            nonlocal batch, pending
+
+            if self._cache is not None:
+                pending.extend(self._load_cached_entities(batch))
+            else:
+                pending.extend(batch)
+            batch = []
+
+            while len(pending) >= size and pending:
+                self._fetch_entities(pending[:_BATCH_SIZE])
+                pending = pending[_BATCH_SIZE:]
+
+        for item in items:
+            if item not in self._entities:
+                batch.append(item)
+
+            if len(batch) == _BATCH_SIZE:
+                flush(_BATCH_SIZE)
+
+        flush(1)
+
+    def get_revisions(self, items: Iterable[str]) -> Dict[str, int]:
+        """Return current revision ids of given items, querying these in batches.
+
+        Missing items get revision 0.
+        """
+        revisions = {}
+        pending = []
+
+        for item in items:
+            if item in self._entities:
+                revisions[item] = self._entities[item][0]
+            else:
+                pending.append(item)
+
+        for start in range(0, len(pending), _BATCH_SIZE):
+            batch = pending[start:start + _BATCH_SIZE]
+            entities = self._query_entities(batch, 'info')
+            for item in batch:
+                revisions[item] = entities.get(item, {}).get('lastrevid', 0)
+
+        return revisions
+
+    def get_missing(self, items: Iterable[str]) -> Set[str]:
+        """Return which of given loaded items don't exist in Wikidata (or are redirects)."""
+        return set(item for item in items if item in self._missing)
+
+    def reload(self, items: Iterable[str]) -> None:
+        """Fetch current state of given items anew.
+
+        Entity cache is bypassed, as its connection may only be used
+        from the thread it was opened in, while this is called from
+        writer threads.
+        """
+        items = list(items)
+
+        for start in range(0, len(items), _BATCH_SIZE):
+            self._load_entities(items[start:start + _BATCH_SIZE])
+
+    def forget(self, items: Iterable[str]) -> None:
+        """Drop loaded entities for given items, to free memory."""
+        for item in items:
+            self._entities.pop(item, None)
+            self._missing.discard(item)
+
+    def _get_claim_index(self, item: str) -> ClaimIndex:
+        if item not in self._entities:
+            self.prefetch([item])
+
+        return self._entities[item][1]
+
+    def get_values(self, item: str, prop: str, allow_deprecated: bool = False) -> FrozenSet[Optional[str]]:
+        """Return set of current (or all, if allow_deprecated) values of item property."""
+        prop_claims = self._get_claim_index(item).get(prop)
+
+        if prop_claims is None:
+            return frozenset()
+
+        return prop_claims.all_values if allow_deprecated else prop_claims.current_values
+
+    @staticmethod
+    def get_retry_delay(error: BaseException) -> Optional[float]:
+        """Return delay before retrying a write which failed due to lag, rate limits or transient errors.
+
+        pywikibot only retries a few times on its own (see max_retries
+        in user-config.py), so persistent lag and network or server
+        failures end up here. None is returned for other errors, which
+        are not worth retrying.
+        """
+        import pywikibot
+
+        if isinstance(error, pywikibot.exceptions.MaxlagTimeoutError):
+            return 60.0
+
+        if isinstance(error, pywikibot.exceptions.APIError) and error.code in ('maxlag', 'ratelimited'):
+            return 10.0
+
+        if isinstance(error, pywikibot.exceptions.ApiTimeoutError):
+            return 60.0
+
+        if isinstance(error, pywikibot.exceptions.ServerError) and not isinstance(error, pywikibot.exceptions.FatalServerError):
+            return 60.0
+
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return 60.0
+
+        return None
+
+    def _get_repo(self) -> Any:
+        """Return pywikibot data repository, logging in on first use."""
+        with self._repo_lock:
+            if self._repo is None:
+                import pywikibot
 
-    def __init__(self) -> None:
-        self._site = pywikibot.Site('wikidata', 'wikidata')
-        self._repo = self._site.data_repository()
-        self._cache_item = ''
-        self._cache_page = None
+                site = pywikibot.Site('wikidata', 'wikidata')
+                site.login()
+                self._repo = site.data_repository()
 
-    def _get_page(self, item: str) -> Any:
-        if self._cache_item != item:
-            self._cache_item = item
-            self._cache_page = pywikibot.ItemPage(self._repo, item)
+            return self._repo
 
-        return self._cache_page
+    @staticmethod
+    def is_edit_conflict(error: BaseException) -> bool:
+        """Check whether a write failed because the item was changed since its base revision."""
+        import pywikibot
 
-    def iter_claims(self, item: str, prop: str, allow_deprecated: bool = False) -> Iterable[Optional[str]]:
-        page = self._get_page(item)
+        if isinstance(error, pywikibot.exceptions.EditConflictError):
+            return True
 
-        page_dict = page.get()
-        claims = page_dict['claims']
+        return isinstance(error, pywikibot.exceptions.APIError) and error.code == 'editconflict'
 
-        if prop not in claims:
-            return
+    def add_claims(self, item: str, values: List[Tuple[str, str]], summary: str, baserevid: int = 0) -> None:
+        """Add multiple (property, value) claims to an item in a single edit.
 
-        for claim in claims[prop]:
-            deprecated = claim.getRank() == 'deprecated'
-            expired = 'P582' in claim.qualifiers
+        If baserevid is given, the edit fails with edit conflict if the
+        item was changed since that revision. The item is not fetched
+        by pywikibot either way.
+        """
+        import pywikibot
 
-            if allow_deprecated or not (deprecated or expired):
-                yield claim.getTarget()
+        repo = self._get_repo()
 
-    def add_claim(self, item: str, prop: str, value: str, summary: str) -> None:
-        page = pywikibot.ItemPage(self._repo, item)
+        claims = []
 
-        claim = pywikibot.Claim(self._repo, prop)
-        claim.setTarget(value)
+        for prop, value in values:
+            claim = pywikibot.Claim(repo, prop)
+            claim.setTarget(value)
+            claims.append(claim.toJSON())
 
-        page.addClaim(claim, summary=summary)
+        repo.editEntity({'id': item}, {'claims': claims}, baserevid=baserevid or None, summary=summary)
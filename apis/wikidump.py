@@ -0,0 +1,174 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import bz2
+import gzip
+import json
+import os
+from typing import Any, Collection, Dict, FrozenSet, IO, Iterable, Iterator, List, Optional, Set, Tuple
+
+from apis.claims import Claim, compact_claims
+
+
+_INDEX_FORMAT = 1
+
+
+def _open_text(path: str, write: bool = False) -> IO[str]:
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'wt' if write else 'rt', encoding='utf-8')
+    elif path.endswith('.gz'):
+        return gzip.open(path, 'wt' if write else 'rt', encoding='utf-8')
+    else:
+        return open(path, 'w' if write else 'r', encoding='utf-8')
+
+
+def _iterate_dump_entities(path: str, props: Collection[str]) -> Iterator[Dict[str, Any]]:
+    """Stream entities having any of given properties from Wikidata JSON dump.
+
+    The dump is a JSON array with one entity per line, so it is
+    parsed line by line and never loaded as a whole.
+    """
+    needles = ['"{}"'.format(prop) for prop in props]
+
+    with _open_text(path) as dump:
+        for line in dump:
+            # cheap substring check skips decoding of most entities
+            if not any(needle in line for needle in needles):
+                continue
+
+            line = line.rstrip().rstrip(',')
+            if line in ('[', ']', ''):
+                continue
+
+            yield json.loads(line)
+
+
+class WikidataDumpIndex:
+    """Index of Wikidata claims built from a JSON dump.
+
+    Only given properties are kept for each entity, along with claim
+    rank, P582 (end time) qualifier presence and entity revision. It
+    provides the same read interface as WikidataApi, and may be used
+    instead of it for offline comparison.
+    """
+
+    _claims: Dict[str, Dict[str, List[Claim]]]
+    _revisions: Dict[str, int]
+    props: List[str]
+    modified: Optional[str]
+
+    def __init__(self, props: Collection[str]) -> None:
+        self._claims = {}
+        self._revisions = {}
+        self.props = sorted(props)
+        self.modified = None
+
+    @staticmethod
+    def from_dump(path: str, props: Collection[str]) -> 'WikidataDumpIndex':
+        index = WikidataDumpIndex(props)
+
+        for entity in _iterate_dump_entities(path, props):
+            claims = compact_claims(entity.get('claims', {}), props)
+            if claims:
+                index._claims[entity['id']] = claims
+                index._revisions[entity['id']] = entity.get('lastrevid', 0)
+
+                if entity.get('modified') and (index.modified is None or entity['modified'] > index.modified):
+                    index.modified = entity['modified']
+
+        return index
+
+    @staticmethod
+    def load(path: str) -> 'WikidataDumpIndex':
+        with _open_text(path) as index_fd:
+            header = json.loads(next(index_fd))
+            if header.get('format') != _INDEX_FORMAT:
+                raise RuntimeError('unsupported dump index format in {}'.format(path))
+
+            index = WikidataDumpIndex(header['props'])
+            index.modified = header.get('modified')
+
+            for line in index_fd:
+                item, revision, claims = line.rstrip('\n').split('\t', 2)
+                index._revisions[item] = int(revision)
+                index._claims[item] = {
+                    prop: [(value, deprecated, expired) for value, deprecated, expired in prop_claims]
+                    for prop, prop_claims in json.loads(claims).items()
+                }
+
+        return index
+
+    def save(self, path: str) -> None:
+        # temporary file name keeps the suffix which defines compression
+        tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path))
+
+        with _open_text(tmp_path, write=True) as index_fd:
+            index_fd.write(json.dumps({'format': _INDEX_FORMAT, 'props': self.props, 'modified': self.modified, 'entities': len(self._claims)}) + '\n')
+
+            for item, claims in sorted(self._claims.items()):
+                index_fd.write('{}\t{}\t{}\n'.format(item, self._revisions[item], json.dumps(claims, separators=(',', ':'))))
+
+        os.replace(tmp_path, path)
+
+    def __len__(self) -> int:
+        return len(self._claims)
+
+    def get_revisions(self, items: Iterable[str]) -> Dict[str, int]:
+        return {item: self._revisions.get(item, 0) for item in items}
+
+    def get_missing(self, items: Iterable[str]) -> Set[str]:
+        # items without any of indexed properties are not in the index
+        # either, so deleted items can't be told apart
+        return set()
+
+    def prefetch(self, items: Iterable[str]) -> None:
+        # everything is already in memory
+        pass
+
+    def forget(self, items: Iterable[str]) -> None:
+        # index is kept as a whole
+        pass
+
+    def get_values(self, item: str, prop: str, allow_deprecated: bool = False) -> FrozenSet[Optional[str]]:
+        return frozenset(self.iter_claims(item, prop, allow_deprecated))
+
+    def iterate_entities(self) -> Iterator[Tuple[str, Dict[str, List[Claim]]]]:
+        """Iterate (item, claims) for all entities in the index."""
+        yield from self._claims.items()
+
+    def iter_claims(self, item: str, prop: str, allow_deprecated: bool = False) -> Iterable[Optional[str]]:
+        for value, deprecated, expired in self._claims.get(item, {}).get(prop, []):
+            if allow_deprecated or not (deprecated or expired):
+                yield value
+
+
+def open_dump_index(dump_path: Optional[str], index_path: str, props: Collection[str]) -> WikidataDumpIndex:
+    """Load dump index, (re)building it from the dump if it's missing or outdated."""
+    if os.path.exists(index_path) and (dump_path is None or os.path.getmtime(index_path) >= os.path.getmtime(dump_path)):
+        index = WikidataDumpIndex.load(index_path)
+
+        # index built for a narrower set of properties is not reusable
+        if dump_path is None or set(props) <= set(index.props):
+            return index
+
+    if dump_path is None:
+        raise RuntimeError('dump index {} does not exist, and no dump to build it from was specified'.format(index_path))
+
+    index = WikidataDumpIndex.from_dump(dump_path, props)
+    index.save(index_path)
+
+    return index
@@ -0,0 +1,229 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of item comparison against the way it was done before.
+
+Both start from claims JSON of entities, as loaded from Wikidata. The
+reference decodes claims JSON on each access, twice per item and
+mapping. The current code decodes claims once per item into value
+sets when entities are loaded, which is included in its timing.
+
+Run as python -m benchmarks.diff [--items N]
+"""
+
+import argparse
+import gc
+import random
+import time
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from actions import Action, AddPropertyAction, MultipleItemsAction, NoValueAction, RemovePropertyAction, TooManyValuesAction
+from actions.diff import ItemProjects, RepologyWikidataMapping, diff_items
+
+from apis.claims import Claim, index_claims
+from apis.repology import RepoField, RepologyProject
+
+
+MAPPINGS = [
+    RepologyWikidataMapping(
+        repo='repo{}'.format(index),
+        prop='P{}'.format(1000 + index),
+        field='srcname',
+        url='https://example.com/{}',
+        histurls=['https://example.com/history/{}'],
+        ignore_missing=index % 3 == 0,
+    )
+    for index in range(12)
+]
+
+
+# claims JSON of entities by item
+ClaimsJson = Dict[str, Dict[str, Any]]
+
+
+def make_claim_json(value: Optional[str], deprecated: bool, expired: bool) -> Dict[str, Any]:
+    claim: Dict[str, Any] = {
+        'mainsnak': {'snaktype': 'novalue'} if value is None else {'snaktype': 'value', 'datavalue': {'value': value, 'type': 'string'}},
+        'rank': 'deprecated' if deprecated else 'normal',
+    }
+
+    if expired:
+        claim['qualifiers'] = {'P582': [{'snaktype': 'somevalue'}]}
+
+    return claim
+
+
+def generate_data(num_items: int, seed: int) -> Tuple[List[ItemProjects], ClaimsJson]:
+    rng = random.Random(seed)
+
+    groups: List[ItemProjects] = []
+    claims_by_item: ClaimsJson = {}
+
+    for itemnum in range(num_items):
+        item = 'Q{}'.format(itemnum + 1)
+        projects = []
+        claims: Dict[str, List[Claim]] = {}
+
+        for projectnum in range(rng.choice((1, 1, 1, 2))):
+            values: Dict[RepoField, Tuple[str, ...]] = {}
+            values[('wikidata', 'name')] = ('Q{}'.format(itemnum + 1 + (1 if rng.random() < 0.01 else 0)),)
+
+            for mapping in MAPPINGS:
+                if rng.random() < 0.5:
+                    num_values = 60 if rng.random() < 0.005 else rng.choice((1, 1, 2))
+                    values[(mapping.repo, mapping.field)] = tuple('value{}'.format(rng.randrange(num_values * 2)) for _ in range(num_values))
+
+            projects.append(RepologyProject('project{}-{}'.format(itemnum, projectnum), values))
+
+        for mapping in MAPPINGS:
+            # most items are already in sync, the rest have
+            # missing, extra, deprecated or valueless claims
+            present = sorted(set(value for project in projects for value in project.values_by_repo_field.get((mapping.repo, mapping.field), ())))
+
+            if rng.random() < 0.9:
+                if present:
+                    claims[mapping.prop] = [(value, False, False) for value in present]
+            elif rng.random() < 0.5:
+                claims[mapping.prop] = [
+                    (
+                        None if rng.random() < 0.1 else 'value{}'.format(rng.randrange(5)),
+                        rng.random() < 0.2,
+                        rng.random() < 0.2,
+                    )
+                    for _ in range(rng.choice((1, 1, 2)))
+                ]
+
+        groups.append((item, projects))
+        claims_by_item[item] = {prop: [make_claim_json(*claim) for claim in prop_claims] for prop, prop_claims in claims.items()}
+
+    return groups, claims_by_item
+
+
+def iter_claims(claims: Dict[str, Any], prop: str, allow_deprecated: bool = False) -> Iterable[Optional[str]]:
+    """Reference claim access, as WikidataApi.iter_claims() did before the diff engine."""
+    if prop not in claims:
+        return
+
+    for claim in claims[prop]:
+        deprecated = claim['rank'] == 'deprecated'
+        expired = 'P582' in claim.get('qualifiers', {})
+
+        if allow_deprecated or not (deprecated or expired):
+            snak = claim['mainsnak']
+            yield str(snak['datavalue']['value']) if snak['snaktype'] == 'value' else None
+
+
+def diff_items_naive(groups: List[ItemProjects], mappings: List[RepologyWikidataMapping], claims_by_item: ClaimsJson, max_entries: int) -> Dict[str, List[Action]]:
+    """Reference per-item, per-mapping comparison as it was done before the diff engine."""
+    actions_by_item: Dict[str, List[Action]] = {}
+
+    for item, projects in groups:
+        actions: List[Action] = []
+        actions_by_item[item] = actions
+
+        projectnames = list(project.name for project in projects)
+
+        wikidata_items: Set[str] = set()
+
+        for project in projects:
+            wikidata_items.update(project.values_by_repo_field.get(('wikidata', 'name'), []))
+
+        if len(wikidata_items) > 1:
+            actions.append(MultipleItemsAction(item=item, projectnames=projectnames))
+            continue
+
+        for mapping in mappings:
+            repology_values: Set[str] = set()
+
+            for project in projects:
+                repology_values.update(project.values_by_repo_field.get((mapping.repo, mapping.field), []))
+
+            wikidata_values = set(iter_claims(claims_by_item[item], mapping.prop))
+            wikidata_all_values = set(iter_claims(claims_by_item[item], mapping.prop, allow_deprecated=True))
+
+            missing = repology_values - wikidata_all_values
+            extra = wikidata_values - repology_values
+
+            if missing and len(repology_values) > max_entries:
+                actions.append(TooManyValuesAction(item=item, projectnames=projectnames, repo=mapping.repo, prop=mapping.prop, count=len(repology_values)))
+                continue
+
+            for mvalue in missing:
+                actions.append(AddPropertyAction(item=item, projectnames=projectnames, repo=mapping.repo, prop=mapping.prop, value=mvalue, url=mapping.url.format(mvalue)))
+
+            for evalue in extra:
+                if evalue is None:
+                    actions.append(NoValueAction(item=item, projectnames=projectnames, repo=mapping.repo, prop=mapping.prop))
+                elif not mapping.ignore_missing:
+                    actions.append(RemovePropertyAction(item=item, projectnames=projectnames, repo=mapping.repo, prop=mapping.prop, value=evalue, url=mapping.url.format(evalue), histurls=[url.format(evalue) for url in mapping.histurls]))
+
+    return actions_by_item
+
+
+def diff_items_current(groups: List[ItemProjects], mappings: List[RepologyWikidataMapping], claims_by_item: ClaimsJson, max_entries: int) -> Dict[str, List[Action]]:
+    """Current comparison, with claims decoded as WikidataApi does on load."""
+    props = [mapping.prop for mapping in mappings]
+    indexes = {item: index_claims(claims_by_item[item], props) for item, _ in groups}
+
+    def get_values(item: str, prop: str, allow_deprecated: bool) -> FrozenSet[Optional[str]]:
+        prop_claims = indexes[item].get(prop)
+
+        if prop_claims is None:
+            return frozenset()
+
+        return prop_claims.all_values if allow_deprecated else prop_claims.current_values
+
+    return diff_items(groups, mappings, get_values, max_entries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=100000, help='number of synthetic items')
+    parser.add_argument('--chunk-size', type=int, default=500, help='number of items compared at once')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, best is reported')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    options = parser.parse_args()
+
+    groups, claims_by_item = generate_data(options.items, options.seed)
+
+    results: Dict[str, Dict[str, List[Action]]] = {}
+    timings: Dict[str, float] = {}
+
+    for name, func in [('naive', diff_items_naive), ('current', diff_items_current)]:
+        for _ in range(options.repeat):
+            gc.collect()
+            start = time.monotonic()
+            result: Dict[str, List[Action]] = {}
+            for offset in range(0, len(groups), options.chunk_size):
+                result.update(func(groups[offset:offset + options.chunk_size], MAPPINGS, claims_by_item, 50))
+            timings[name] = min(timings.get(name, float('inf')), time.monotonic() - start)
+            results[name] = result
+
+    for item, _ in groups:
+        if sorted(map(repr, results['naive'][item])) != sorted(map(repr, results['current'][item])):
+            raise RuntimeError('action mismatch for {}'.format(item))
+
+    num_actions = sum(len(actions) for actions in results['current'].values())
+
+    print('{} items, {} mappings, {} actions'.format(len(groups), len(MAPPINGS), num_actions))
+    for name, seconds in timings.items():
+        print('{:>7}: {:.2f} s, {:.0f} items/s'.format(name, seconds, len(groups) / seconds))
+    print('speedup: {:.2f}x'.format(timings['naive'] / timings['current']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Local stand-ins for Repology projects API, Wikidata action API and query service.
+
+Both serve the same synthetic dataset, so comparison finds a
+predictable share of differences. Latency is added to every request,
+and a share of requests fails with errors the bot is expected to
+recover from: 503 with Retry-After for Repology pages, and maxlag
+errors for Wikidata reads and edits.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Counter, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+import requests
+
+
+# same as Repology API page size
+_PAGE_SIZE = 200
+
+
+class Dataset:
+    """Synthetic set of projects and matching Wikidata items."""
+
+    projects: Dict[str, List[Dict[str, str]]]
+    entities: Dict[str, Dict[str, Any]]
+
+    def __init__(self, num_projects: int, mappings: List[Tuple[str, str, str]], seed: int = 1) -> None:
+        """Generate dataset for given list of (repo, field, prop) mappings."""
+        rng = random.Random(seed)
+
+        self.projects = {}
+        self.entities = {}
+
+        for num in range(num_projects):
+            name = 'project{:07d}'.format(num)
+            item = 'Q{}'.format(num + 1)
+
+            packages_by_repo: Dict[str, Dict[str, str]] = {}
+            claims: Dict[str, List[Dict[str, Any]]] = {}
+
+            for repo, field, prop in mappings:
+                if rng.random() >= 0.3:
+                    continue
+
+                value = '{}-{}'.format(name, field)
+                packages_by_repo.setdefault(repo, {'repo': repo, 'name': name})[field] = value
+
+                # most items are in sync, some lack or have different values
+                chance = rng.random()
+                if chance < 0.8:
+                    claims[prop] = [_make_claim(value)]
+                elif chance < 0.9:
+                    claims[prop] = [_make_claim(value + '-old')]
+
+            self.projects[name] = [{'repo': 'wikidata', 'name': item}] + list(packages_by_repo.values())
+            self.entities[item] = {'id': item, 'lastrevid': 1, 'claims': claims}
+
+
+def _make_claim(value: str) -> Dict[str, Any]:
+    return {
+        'rank': 'normal',
+        'mainsnak': {
+            'snaktype': 'value',
+            'datavalue': {'value': value, 'type': 'string'},
+        },
+    }
+
+
+class StandInServer:
+    """Base of stand-in HTTP servers running in background thread."""
+
+    dataset: Dataset
+    latency: float
+    error_rate: float
+    requests: Counter[str]
+
+    _server: ThreadingHTTPServer
+    _lock: threading.Lock
+    _rng: random.Random
+
+    def __init__(self, dataset: Dataset, latency: float = 0.0, error_rate: float = 0.0) -> None:
+        self.dataset = dataset
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                stand_in._handle(self, None)
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stand_in._handle(self, {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()})
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def address(self) -> str:
+        return 'http://127.0.0.1:{}'.format(self._server.server_port)
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def _handle(self, request: BaseHTTPRequestHandler, form: Optional[Dict[str, str]]) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+        status, headers, body = self.respond(urlparse(request.path), form)
+
+        request.send_response(status)
+        for key, value in headers.items():
+            request.send_header(key, value)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def respond(self, url: Any, form: Optional[Dict[str, str]]) -> Tuple[int, Dict[str, str], bytes]:
+        raise NotImplementedError
+
+
+class RepologyStandIn(StandInServer):
+    """Stand-in for Repology projects API (/api/v1/projects/[<name>/])."""
+
+    _names: List[str]
+
+    def __init__(self, dataset: Dataset, latency: float = 0.0, error_rate: float = 0.0) -> None:
+        self._names = sorted(dataset.projects.keys())
+        super().__init__(dataset, latency, error_rate)
+
+    @property
+    def apiurl(self) -> str:
+        return self.address + '/api/v1/projects/'
+
+    def respond(self, url: Any, form: Optional[Dict[str, str]]) -> Tuple[int, Dict[str, str], bytes]:
+        if self._should_fail():
+            self._count('failed')
+            return 503, {'Retry-After': '0'}, b''
+
+        self._count('pages')
+
+        path = url.path.split('/')
+        pivot = unquote(path[-2]) if path[-2] != 'projects' else ''
+
+        names = [name for name in self._names if name >= pivot][:_PAGE_SIZE]
+
+        return 200, {'Content-Type': 'application/json'}, json.dumps({name: self.dataset.projects[name] for name in names}).encode('utf-8')
+
+
+class WikidataStandIn(StandInServer):
+    """Stand-in for Wikidata action API: wbgetentities and wbeditentity.
+
+    It also serves as query service at /sparql, which only supports
+    queries of all non-deprecated values of a property.
+    """
+
+    edits: List[Tuple[str, Any]]
+
+    def __init__(self, dataset: Dataset, latency: float = 0.0, error_rate: float = 0.0) -> None:
+        self.edits = []
+        super().__init__(dataset, latency, error_rate)
+
+    @property
+    def apiurl(self) -> str:
+        return self.address + '/w/api.php'
+
+    @property
+    def sparqlurl(self) -> str:
+        return self.address + '/sparql'
+
+    def _respond_sparql(self, query: str) -> Tuple[int, Dict[str, str], bytes]:
+        match = re.search('ps:(P[0-9]+)', query)
+        if match is None:
+            self._count('unknown')
+            return 400, {'Content-Type': 'text/plain'}, b'Unsupported query'
+
+        self._count('sparql')
+
+        prop = match.group(1)
+        bindings = [
+            {
+                'item': {'type': 'uri', 'value': 'http://www.wikidata.org/entity/' + item},
+                'value': {'type': 'literal', 'value': claim['mainsnak']['datavalue']['value']},
+            }
+            for item, entity in self.dataset.entities.items()
+            for claim in entity['claims'].get(prop, [])
+            if claim['rank'] != 'deprecated'
+        ]
+
+        return 200, {'Content-Type': 'application/sparql-results+json'}, json.dumps({'head': {'vars': ['item', 'value']}, 'results': {'bindings': bindings}}).encode('utf-8')
+
+    def respond(self, url: Any, form: Optional[Dict[str, str]]) -> Tuple[int, Dict[str, str], bytes]:
+        params = form if form is not None else {key: values[0] for key, values in parse_qs(url.query).items()}
+        headers = {'Content-Type': 'application/json'}
+
+        if url.path == '/sparql':
+            return self._respond_sparql(params.get('query', ''))
+
+        if params.get('action') == 'wbgetentities':
+            if self._should_fail():
+                self._count('entities_lagged')
+                return 200, dict(headers, **{'Retry-After': '0'}), json.dumps({'error': {'code': 'maxlag', 'info': 'Waiting for a database server'}}).encode('utf-8')
+
+            props = params.get('props', 'info|claims').split('|')
+            self._count('entities_' + ('full' if 'claims' in props else 'info'))
+
+            entities = {}
+            for item in params['ids'].split('|'):
+                entity = self.dataset.entities.get(item)
+                if entity is None:
+                    entities[item] = {'id': item, 'missing': ''}
+                else:
+                    entities[item] = {key: value for key, value in entity.items() if key in ('id', 'lastrevid') or key in props}
+
+            return 200, headers, json.dumps({'entities': entities}).encode('utf-8')
+
+        if params.get('action') == 'wbeditentity':
+            if self._should_fail():
+                self._count('edits_lagged')
+                return 200, headers, json.dumps({'error': {'code': 'maxlag', 'info': 'Waiting for a database server'}}).encode('utf-8')
+
+            self._count('edits')
+
+            with self._lock:
+                self.edits.append((params['id'], json.loads(params['data'])))
+
+            return 200, headers, json.dumps({'success': 1}).encode('utf-8')
+
+        self._count('unknown')
+        return 200, headers, json.dumps({'error': {'code': 'badvalue', 'info': 'Unsupported action'}}).encode('utf-8')
+
+
+class StandInLagError(RuntimeError):
+    pass
+
+
+class StandInWriter:
+    """Writes claims to WikidataStandIn, like WikidataApi does to Wikidata."""
+
+    _apiurl: str
+    _session: requests.Session
+
+    def __init__(self, apiurl: str) -> None:
+        self._apiurl = apiurl
+        self._session = requests.Session()
+
+    def add_claims(self, item: str, values: List[Tuple[str, str]], summary: str, baserevid: int = 0) -> None:
+        data = {
+            'claims': [
+                {
+                    'mainsnak': {'snaktype': 'value', 'property': prop, 'datavalue': {'value': value, 'type': 'string'}},
+                    'type': 'statement',
+                    'rank': 'normal',
+                }
+                for prop, value in values
+            ]
+        }
+
+        result = self._session.post(self._apiurl, data={'action': 'wbeditentity', 'id': item, 'data': json.dumps(data), 'summary': summary, 'format': 'json'}, timeout=60).json()
+
+        if 'error' in result:
+            if result['error']['code'] == 'maxlag':
+                raise StandInLagError(result['error']['info'])
+            raise RuntimeError(result['error']['info'])
+
+    @staticmethod
+    def get_retry_delay(error: BaseException) -> Optional[float]:
+        return 0.1 if isinstance(error, StandInLagError) else None
+
+    @staticmethod
+    def is_edit_conflict(error: BaseException) -> bool:
+        # stand-in never changes entities, so edits never conflict
+        return False
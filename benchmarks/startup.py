@@ -0,0 +1,98 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the bot startup time.
+
+Measures time of running the bot with --help (interpreter startup and
+all imports), and, in a fresh interpreter each time, time of loading
+the bot and constructing WikidataApi, as done before gathering starts,
+along with whether pywikibot was imported by that point. Time of
+importing pywikibot itself is measured for comparison.
+
+Run as python -m benchmarks.startup [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LOAD_SCRIPT = """
+import importlib.util, json, sys, time
+start = time.monotonic()
+spec = importlib.util.spec_from_file_location('bot', 'repology-wikidata-bot.py')
+bot = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bot)
+loaded = time.monotonic()
+bot.WikidataApi()
+created = time.monotonic()
+print(json.dumps({'load': loaded - start, 'create': created - loaded, 'pywikibot': 'pywikibot' in sys.modules}))
+"""
+
+_PYWIKIBOT_SCRIPT = """
+import json, time
+start = time.monotonic()
+import pywikibot
+print(json.dumps({'import': time.monotonic() - start}))
+"""
+
+
+def run_python(args: List[str]) -> float:
+    start = time.monotonic()
+    subprocess.run([sys.executable] + args, cwd=_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.monotonic() - start
+
+
+def run_script(script: str) -> Dict[str, Any]:
+    result = subprocess.run([sys.executable, '-c', script], cwd=_ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    return json.loads(result.stdout.decode('utf-8').strip().splitlines()[-1])  # type: ignore
+
+
+def summarize(values: List[float]) -> str:
+    return 'min {:.3f} s, median {:.3f} s'.format(min(values), statistics.median(values))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10, help='number of runs of each measurement')
+    options = parser.parse_args()
+
+    help_times = [run_python(['repology-wikidata-bot.py', '--help']) for _ in range(options.runs)]
+    print('bot --help:                   {}'.format(summarize(help_times)))
+
+    loads = [run_script(_LOAD_SCRIPT) for _ in range(options.runs)]
+    print('loading bot:                  {}'.format(summarize([load['load'] for load in loads])))
+    print('constructing WikidataApi:     {}'.format(summarize([load['create'] for load in loads])))
+    print('pywikibot imported by then:   {}'.format('yes' if any(load['pywikibot'] for load in loads) else 'no'))
+
+    try:
+        imports = [run_script(_PYWIKIBOT_SCRIPT) for _ in range(options.runs)]
+    except subprocess.CalledProcessError:
+        print('importing pywikibot:          failed (not installed or not configured)')
+    else:
+        print('importing pywikibot:          {}'.format(summarize([result['import'] for result in imports])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the whole bot against local stand-in servers.
+
+Gather, compare, report and apply phases are timed separately, and
+throughput, request counts and peak memory of each phase are written
+to a JSON file which may be compared between commits. Arguments after
+-- are passed to the bot, e.g.
+
+python -m benchmarks.suite --projects 20000 --latency 0.02 -- --compare-jobs 4
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from benchmarks.servers import Dataset, RepologyStandIn, StandInWriter, WikidataStandIn
+
+
+_BOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'repology-wikidata-bot.py')
+
+
+def load_bot() -> Any:
+    spec = importlib.util.spec_from_file_location('repology_wikidata_bot', _BOT_PATH)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    # registered, so functions of the module may be run in worker processes
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(_BOT_PATH), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def reset_peak_rss() -> bool:
+    """Reset peak RSS of the process, so it may be measured per phase.
+
+    This is only supported on Linux; False is returned if peak RSS
+    could not be reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+
+    return True
+
+
+def get_peak_rss() -> Optional[int]:
+    """Return peak RSS of the process in KiB since the last reset."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+
+    return None
+
+
+def get_max_rss() -> int:
+    # peak RSS since process start, in KiB on Linux, in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class PhaseTimer:
+    """Collect time, request counts and peak memory per phase.
+
+    Peak memory (peak_rss) is that of the benchmark process (worker
+    processes of the bot are not accounted) during the phase, including
+    memory still held from previous phases. Where it
+    can't be reset between phases, only peak memory since the start of
+    the benchmark is known, which is reported as max_rss_so_far instead.
+    """
+
+    phases: Dict[str, Dict[str, Any]]
+
+    def __init__(self, servers: Dict[str, Any]) -> None:
+        self.phases = {}
+        self._servers = servers
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[Dict[str, Any]]:
+        result: Dict[str, Any] = {}
+        requests_before = {server_name: dict(server.requests) for server_name, server in self._servers.items()}
+
+        print('Running {} phase'.format(name), file=sys.stderr)
+
+        peak_rss_reset = reset_peak_rss()
+
+        start = time.monotonic()
+        yield result
+        result['seconds'] = time.monotonic() - start
+
+        result['requests'] = {
+            server_name: {kind: count - requests_before[server_name].get(kind, 0) for kind, count in server.requests.items() if count > requests_before[server_name].get(kind, 0)}
+            for server_name, server in self._servers.items()
+        }
+        if peak_rss_reset:
+            result['peak_rss'] = get_peak_rss()
+        else:
+            result['max_rss_so_far'] = get_max_rss()
+
+        if 'count' in result:
+            result['per_second'] = result['count'] / result['seconds'] if result['seconds'] > 0 else None
+
+        self.phases[name] = result
+
+
+def run_benchmark(options: argparse.Namespace, bot_args: List[str]) -> Dict[str, Any]:
+    bot = load_bot()
+
+    mappings = [(mapping.repo, mapping.field, mapping.prop) for mapping in bot.PACKAGE_MAPPINGS]
+    dataset = Dataset(options.projects, mappings, seed=options.seed)
+
+    repology = RepologyStandIn(dataset, latency=options.latency, error_rate=options.error_rate)
+    wikidata = WikidataStandIn(dataset, latency=options.latency, error_rate=options.lag_rate)
+
+    workdir = tempfile.TemporaryDirectory()
+
+    bot_options = bot.parse_arguments(
+        [
+            '--repology-api', repology.apiurl,
+            '--wikidata-api', wikidata.apiurl,
+            '--sparql-api', wikidata.sparqlurl,
+            '--blacklist', os.devnull,
+            '--write-rate', '1000',
+            '--max-write-rate', '1000',
+            '--write-workers', '4',
+            '--yes',
+        ] + bot_args
+    )
+
+    timer = PhaseTimer({'repology': repology, 'wikidata': wikidata})
+
+    try:
+        with timer.phase('gather') as result:
+            item_groups = list(bot.iterate_item_groups(bot_options))
+            result['count'] = len(item_groups)
+
+        with timer.phase('compare') as result:
+            source = bot.create_wikidata_source(bot_options)
+            actions = bot.compute_actions(item_groups, source, bot_options)
+            result['count'] = len(item_groups)
+            result['actions'] = len(actions)
+
+        if bot_options.check_duplicates:
+            with timer.phase('check_duplicates') as result:
+                with contextlib.redirect_stderr(io.StringIO()):
+                    actions = bot.check_duplicate_values(actions, source, bot_options)
+                result['count'] = len(actions)
+
+        with timer.phase('report') as result:
+            report = list(bot.aggregate_report(actions))
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                bot.format_text_report(report, bot_options.verbose)
+            with open(os.path.join(workdir.name, 'report.html'), 'w') as html:
+                bot.write_html_report(report, html)
+            result['count'] = len(report)
+
+        if not options.skip_apply:
+            with timer.phase('apply') as result:
+                bot.apply_actions(actions, StandInWriter(wikidata.apiurl), bot_options)
+                result['count'] = len(wikidata.edits)
+    finally:
+        repology.close()
+        wikidata.close()
+        workdir.cleanup()
+
+    return {
+        'revision': get_revision(),
+        'python': platform.python_version(),
+        'config': {
+            'projects': options.projects,
+            'latency': options.latency,
+            'error_rate': options.error_rate,
+            'lag_rate': options.lag_rate,
+            'seed': options.seed,
+            'bot_args': bot_args,
+        },
+        'phases': timer.phases,
+        'total_seconds': sum(phase['seconds'] for phase in timer.phases.values()),
+    }
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    bot_args = []
+
+    if '--' in args:
+        bot_args = args[args.index('--') + 1:]
+        args = args[:args.index('--')]
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--projects', metavar='N', type=int, default=10000, help='number of synthetic projects')
+    parser.add_argument('--latency', metavar='SECONDS', type=float, default=0.0, help='latency added to each stand-in server request')
+    parser.add_argument('--error-rate', metavar='RATIO', type=float, default=0.0, help='share of Repology requests which fail with 503')
+    parser.add_argument('--lag-rate', metavar='RATIO', type=float, default=0.0, help='share of Wikidata edits which fail with maxlag error')
+    parser.add_argument('--seed', metavar='N', type=int, default=1, help='random seed for synthetic dataset')
+    parser.add_argument('--skip-apply', action='store_true', help='do not run apply phase')
+    parser.add_argument('--output', metavar='PATH', default='benchmark.json', help='path to JSON results file')
+    options = parser.parse_args(args)
+
+    results = run_benchmark(options, bot_args)
+
+    with open(options.output, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+        output.write('\n')
+
+    for name, phase in results['phases'].items():
+        rss = 'peak RSS {}'.format(phase['peak_rss']) if 'peak_rss' in phase else 'max RSS so far {}'.format(phase['max_rss_so_far'])
+        print('{:>8}: {:7.2f} s, {:>9} /s, {}'.format(name, phase['seconds'], '{:.0f}'.format(phase['per_second']) if phase.get('per_second') else '-', rss), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
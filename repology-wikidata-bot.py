@@ -18,33 +18,43 @@
 # along with repology.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import hashlib
+import json
+import os
 import sys
-from collections import defaultdict
-from dataclasses import dataclass
-from typing import Dict, List, Set
-
-from actions import Action, ActionPerformer, AddPropertyAction, MultipleItemsAction, NoValueAction, RemovePropertyAction, TooManyValuesAction
-
-from apis.repology import RepologyProject, iterate_repology_projects
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from actions import Action, ActionPerformer, DuplicateValueAction, group_actions_by_item
+from actions.diff import RepologyWikidataMapping, diff_items
+from actions.duplicates import flag_duplicate_values, get_added_values
+from actions.plan import PLAN_SOURCE_API, PLAN_SOURCE_DUMP, PlanJournal, get_plan_digest, load_plan, save_plan
+from actions.scheduler import WriteScheduler
+from actions.state import StateStore
+
+from apis.cache import EntityCache, PageCache
+from apis.claims import PropertyValueIndex, compact_claims
+from apis.repology import RepoField, RepologyProject, create_repology_client, iterate_repology_projects, split_repology_name_range
+from apis.sparql import create_sparql_client, iterate_property_values
 from apis.wikidata import WikidataApi
+from apis.wikidump import WikidataDumpIndex, open_dump_index
 
 from reports import aggregate_report
-from reports.html import format_html_report
+from reports.delta import ActionKey, compute_report_delta, iterate_report_index, save_report_index
+from reports.html import write_html_report, write_paginated_html_report
 from reports.text import format_text_report
 
+from utils.extsort import external_sort
+from utils.metrics import metrics
+from utils.namematcher import NameMatcher
+from utils.prefetch import chain_prefetched
 from utils.progress import progressify
 
 
-@dataclass
-class RepologyWikidataMapping:
-    repo: str
-    prop: str
-    field: str
-    url: str
-    histurls: List[str]
-    ignore_missing: bool = False
-
-
 PACKAGE_MAPPINGS = [
     RepologyWikidataMapping(
         repo='gentoo',
@@ -195,133 +205,442 @@ PACKAGE_MAPPINGS = [
 ]
 
 
-def construct_blacklist(options: argparse.Namespace) -> Set[str]:
-    blacklist: Set[str] = set()
+def is_mapping_selected(mapping: RepologyWikidataMapping, options: argparse.Namespace) -> bool:
+    return not options.repositories or mapping.repo in options.repositories or mapping.prop in options.repositories
+
+
+def get_needed_fields(options: argparse.Namespace) -> Set[RepoField]:
+    fields = {('wikidata', 'name')}
+
+    for mapping in PACKAGE_MAPPINGS:
+        if is_mapping_selected(mapping, options):
+            fields.add((mapping.repo, mapping.field))
+
+    return fields
+
+
+def construct_blacklist(options: argparse.Namespace) -> NameMatcher:
+    patterns: List[str] = []
 
     if options.blacklist:
         with open(options.blacklist, 'r') as blacklist_fd:
             for line in blacklist_fd:
-                item = line.split('#', 1)[0].strip()
+                pattern = line.split('#', 1)[0].strip()
 
-                if item:
-                    blacklist.add(item)
+                if pattern:
+                    patterns.append(pattern)
 
     if options.exclude:
-        blacklist.update(options.exclude)
+        patterns.extend(options.exclude)
 
-    return blacklist
+    return NameMatcher(patterns)
 
 
 ProjectsByItem = Dict[str, List[RepologyProject]]
+WikidataSource = Union[WikidataApi, WikidataDumpIndex]
 
+# number of items compared at once; Wikidata entities are fetched
+# for the whole chunk before comparing it
+_COMPARE_CHUNK_SIZE = 500
 
-def gather_repology_projects(options: argparse.Namespace) -> ProjectsByItem:
-    blacklist = construct_blacklist(options)
 
-    projects_by_item: ProjectsByItem = defaultdict(list)
+def iterate_gathered_projects(options: argparse.Namespace) -> Iterable[RepologyProject]:
+    cache = PageCache(options.cache_dir, ttl=options.cache_ttl, offline=options.offline) if options.cache_dir else None
+    fields = get_needed_fields(options)
+    client = create_repology_client(timeout=options.timeout, retries=options.retries, pool_size=max(options.jobs, 1))
+
+    if options.shards <= 1:
+        repology_iter = iterate_repology_projects(apiurl=options.repology_api, begin_name=options.from_, end_name=options.to, prefetch=options.prefetch_pages, client=client, cache=cache, fields=fields)
 
-    repology_iter = iterate_repology_projects(apiurl=options.repology_api, begin_name=options.from_, end_name=options.to)
+        yield from progressify(repology_iter, 'Gathering projects from Repology')
+    else:
+        def iterate_shard(begin_name: Optional[str], stop_name: Optional[str]) -> Iterable[RepologyProject]:
+            return iterate_repology_projects(apiurl=options.repology_api, begin_name=begin_name, end_name=options.to, stop_name=stop_name, prefetch=options.prefetch_pages, client=client, cache=cache, fields=fields)
 
-    for project in progressify(repology_iter, 'Gathering projects from Repology'):
+        def gather_shard(begin_name: Optional[str], stop_name: Optional[str]) -> List[RepologyProject]:
+            return list(iterate_shard(begin_name, stop_name))
+
+        shards = split_repology_name_range(options.from_, options.to, options.shards)
+
+        if options.low_memory:
+            # shards are streamed in order, and only a part of sort buffer
+            # worth of projects is kept ready for each shard being gathered
+            shard_iters = [iterate_shard(begin_name, stop_name) for begin_name, stop_name in shards]
+            yield from progressify(chain_prefetched(shard_iters, depth=options.sort_buffer // max(options.jobs, 1), jobs=options.jobs), 'Gathering projects from Repology shards')
+        else:
+            with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+                futures = [executor.submit(gather_shard, begin_name, stop_name) for begin_name, stop_name in shards]
+
+                # merge in shard order, so the result is the same as for a single cursor
+                for future in progressify(futures, 'Gathering projects from Repology shards'):
+                    yield from future.result()
+
+    if options.verbose:
+        print(
+            'Repology API: {} requests, {} retries, {:.1f} MiB received in {:.1f} seconds'.format(
+                client.stats.num_requests,
+                client.stats.num_retries,
+                client.stats.num_bytes / 1048576,
+                client.stats.seconds
+            ),
+            file=sys.stderr
+        )
+
+
+def iterate_item_projects(options: argparse.Namespace) -> Iterable[Tuple[str, RepologyProject]]:
+    blacklist = construct_blacklist(options)
+
+    for project in iterate_gathered_projects(options):
         if project.name not in blacklist:
             for item in project.values_by_repo_field.get(('wikidata', 'name'), []):
                 if item not in blacklist:
-                    projects_by_item[item].append(project)
+                    yield item, project
+
+
+def gather_repology_projects(options: argparse.Namespace) -> ProjectsByItem:
+    projects_by_item: ProjectsByItem = defaultdict(list)
+
+    for item, project in iterate_item_projects(options):
+        projects_by_item[item].append(project)
 
     return projects_by_item
 
 
-def run(options: argparse.Namespace) -> None:
-    projects_by_item = gather_repology_projects(options)
+def gather_repology_projects_sorted(options: argparse.Namespace) -> Iterable[Tuple[str, List[RepologyProject]]]:
+    """Gather projects grouped by item, like gather_repology_projects() does, but with bounded memory.
+
+    (item, project) pairs are spilled to disk in sorted runs and merged
+    back, so only a single item group is kept in memory at a time. The
+    groups are produced in item order.
+    """
+    records = external_sort(iterate_item_projects(options), key=itemgetter(0), run_size=options.sort_buffer)
+
+    for item, group in groupby(records, key=itemgetter(0)):
+        yield item, [project for _, project in group]
+
+
+def create_wikidata_source(options: argparse.Namespace) -> WikidataSource:
+    if options.wikidata_dump or options.dump_index:
+        print('Loading Wikidata dump index', file=sys.stderr)
+        index = open_dump_index(
+            options.wikidata_dump,
+            options.dump_index or options.wikidata_dump + '.index.gz',
+            [mapping.prop for mapping in PACKAGE_MAPPINGS]
+        )
+        print('Wikidata dump index contains {} entities, last modified at {}'.format(len(index), index.modified), file=sys.stderr)
+        return index
+
+    entity_cache = EntityCache(options.entity_cache) if options.entity_cache else None
+    return WikidataApi(apiurl=options.wikidata_api, cache=entity_cache, props=[mapping.prop for mapping in PACKAGE_MAPPINGS])
+
+
+def fingerprint_item(projects: List[RepologyProject], options: argparse.Namespace) -> str:
+    """Compute fingerprint of everything from Repology an item comparison depends on."""
+    values: Dict[str, List[str]] = {}
+
+    for mapping in PACKAGE_MAPPINGS:
+        if is_mapping_selected(mapping, options):
+            values[mapping.prop] = sorted(set(value for project in projects for value in project.values_by_repo_field.get((mapping.repo, mapping.field), [])))
+
+    data = {
+        'projectnames': [project.name for project in projects],
+        'items': sorted(set(item for project in projects for item in project.values_by_repo_field.get(('wikidata', 'name'), []))),
+        'values': values,
+        'max_entries': options.max_entries,
+    }
+
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def compare_items(chunk: List[Tuple[str, List[RepologyProject]]], wikidata: WikidataSource, options: argparse.Namespace) -> Dict[str, List[Action]]:
+    wikidata.prefetch(item for item, _ in chunk)
+
+    # revisions of just loaded entities are known without extra requests
+    base_revisions = wikidata.get_revisions(item for item, _ in chunk)
+    missing = wikidata.get_missing(item for item, _ in chunk)
+
+    mappings = [mapping for mapping in PACKAGE_MAPPINGS if is_mapping_selected(mapping, options)]
+
+    return diff_items(chunk, mappings, wikidata.get_values, options.max_entries, base_revisions, missing)
+
+
+# Wikidata source of a comparison worker process
+_worker_wikidata: Optional[WikidataSource] = None
+
+
+def init_compare_worker(wikidata: Optional[WikidataSource], options: argparse.Namespace) -> None:
+    global _worker_wikidata
+
+    # Wikidata API sessions and entity cache connections cannot be
+    # shared between processes, so each worker opens its own
+    _worker_wikidata = wikidata if wikidata is not None else create_wikidata_source(options)
+
+
+def compare_items_in_worker(chunk: List[Tuple[str, List[RepologyProject]]], options: argparse.Namespace) -> Dict[str, List[Action]]:
+    assert _worker_wikidata is not None
+
+    actions_by_item = compare_items(chunk, _worker_wikidata, options)
+
+    # entities are not needed by the main process, so workers never keep them
+    _worker_wikidata.forget(item for item, _ in chunk)
+
+    return actions_by_item
 
-    wikidata = WikidataApi()
+
+def compare_chunk(chunk: List[Tuple[str, List[RepologyProject]]], wikidata: WikidataSource, state: Optional[StateStore], executor: Optional[Executor], options: argparse.Namespace) -> Callable[[], List[Action]]:
+    """Start comparison of a chunk of items.
+
+    Returns a function which waits for the comparison to finish and
+    returns resulting actions. Stored outcomes are reused for unchanged
+    items if state is used. If executor is given, entities are fetched
+    and compared in a worker process.
+    """
+    reused_actions: List[Action] = []
+
+    if state is not None:
+        fingerprints = {item: fingerprint_item(projects, options) for item, projects in chunk}
+        revisions = wikidata.get_revisions(fingerprints.keys())
+        stored = state.get_many(fingerprints.keys())
+
+        changed = []
+
+        for item, projects in chunk:
+            if item in stored and stored[item][0] == fingerprints[item] and stored[item][1] == revisions[item]:
+                reused_actions.extend(stored[item][2])
+            else:
+                changed.append((item, projects))
+
+        metrics.inc('cache_requests_total', len(chunk) - len(changed), cache='state', result='hit')
+        metrics.inc('cache_requests_total', len(changed), cache='state', result='miss')
+
+        chunk = changed
+
+    future: 'Future[Dict[str, List[Action]]]'
+
+    if executor is not None:
+        future = executor.submit(compare_items_in_worker, chunk, options)
+    else:
+        future = Future()
+        future.set_result(compare_items(chunk, wikidata, options))
+
+        if options.low_memory:
+            wikidata.forget(item for item, _ in chunk)
+
+    def finish() -> List[Action]:
+        actions = reused_actions
+        outcomes = []
+
+        for item, item_actions in future.result().items():
+            actions.extend(item_actions)
+
+            if state is not None:
+                outcomes.append((item, fingerprints[item], revisions[item], item_actions))
+
+        if state is not None:
+            state.store_many(outcomes)
+
+        return actions
+
+    return finish
+
+
+def iterate_item_groups(options: argparse.Namespace) -> Iterable[Tuple[str, List[RepologyProject]]]:
+    if options.low_memory:
+        return gather_repology_projects_sorted(options)
+    else:
+        return gather_repology_projects(options).items()
+
+
+def compute_actions(item_groups: Iterable[Tuple[str, List[RepologyProject]]], wikidata: WikidataSource, options: argparse.Namespace) -> List[Action]:
+    state = StateStore(options.incremental) if options.incremental else None
+
+    item_groups_iter = iter(progressify(item_groups, 'Comparing to Wikidata'))
+
+    # chunks are fetched and compared in worker processes if requested;
+    # results are collected in submission order, so output does not
+    # depend on the number of processes. Dump index is passed to workers
+    # as is (and is shared with them where processes are forked)
+    executor = None
+    if options.compare_jobs > 1:
+        shared_wikidata = wikidata if isinstance(wikidata, WikidataDumpIndex) else None
+        executor = ProcessPoolExecutor(options.compare_jobs, initializer=init_compare_worker, initargs=(shared_wikidata, options))
+    pending: Deque[Callable[[], List[Action]]] = deque()
 
     actions: List[Action] = []
 
-    for item, projects in progressify(projects_by_item.items(), 'Comparing to Wikidata'):
-        projectnames = list(project.name for project in projects)
+    while True:
+        chunk = list(islice(item_groups_iter, _COMPARE_CHUNK_SIZE))
+        if not chunk:
+            break
+
+        pending.append(compare_chunk(chunk, wikidata, state, executor, options))
+
+        while len(pending) > options.compare_jobs:
+            actions.extend(pending.popleft()())
+
+    while pending:
+        actions.extend(pending.popleft()())
+
+    if executor is not None:
+        executor.shutdown()
 
-        wikidata_items: Set[str] = set()
+    if state is not None:
+        state.close()
 
-        for project in projects:
-            wikidata_items.update(project.values_by_repo_field.get(('wikidata', 'name'), []))
+    return actions
 
-        if len(wikidata_items) > 1:
-            actions.append(MultipleItemsAction(item=item, projectnames=projectnames))
-            continue
 
-        for mapping in PACKAGE_MAPPINGS:
-            if options.repositories and mapping.repo not in options.repositories and mapping.prop not in options.repositories:
-                continue
+def check_duplicate_values(actions: List[Action], wikidata: WikidataSource, options: argparse.Namespace) -> List[Action]:
+    """Flag additions of values which are already used by other items.
 
-            repology_values: Set[str] = set()
+    Existing values are collected in bulk into a reverse index, from
+    SPARQL endpoint if specified (a single query per property), from
+    Wikidata dump index if it's used, or otherwise from entity cache
+    (which only covers items processed by the bot).
+    """
+    keys = get_added_values(actions)
+    if not keys:
+        return actions
 
-            for project in projects:
-                repology_values.update(project.values_by_repo_field.get((mapping.repo, mapping.field), []))
+    index = PropertyValueIndex(keys)
+    props = sorted(set(prop for prop, _ in keys))
 
-            wikidata_values = set(wikidata.iter_claims(item, mapping.prop))
-            wikidata_all_values = set(wikidata.iter_claims(item, mapping.prop, allow_deprecated=True))
+    if options.sparql_api:
+        # queries of all values of a property take long, so client
+        # has its own timeout rather than one of Repology requests
+        client = create_sparql_client()
+        for prop in props:
+            for item, value in iterate_property_values(options.sparql_api, prop, client):
+                index.add(item, prop, value)
+    elif isinstance(wikidata, WikidataDumpIndex):
+        for item, claims in wikidata.iterate_entities():
+            index.add_claims(item, claims)
+    else:
+        entity_cache = EntityCache(options.entity_cache)
+        for item, _, data in entity_cache.iterate():
+            index.add_claims(item, compact_claims(data, props))
+        entity_cache.close()
 
-            missing = repology_values - wikidata_all_values
-            extra = wikidata_values - repology_values
+    actions = flag_duplicate_values(actions, index)
 
-            if missing and len(repology_values) > options.max_entries:
-                actions.append(
-                    TooManyValuesAction(
-                        item=item,
-                        projectnames=projectnames,
-                        repo=mapping.repo,
-                        prop=mapping.prop,
-                        count=len(repology_values)
-                    )
-                )
+    print('Found {} additions of values used by other items'.format(sum(1 for action in actions if isinstance(action, DuplicateValueAction))), file=sys.stderr)
+
+    return actions
+
+
+def apply_actions(actions: List[Action], wikidata: WikidataApi, options: argparse.Namespace) -> None:
+    performer = ActionPerformer(wikidata)
+
+    journal = PlanJournal(options.apply_plan + '.journal', get_plan_digest(options.apply_plan)) if options.apply_plan else None
+
+    actions = [action for action in actions if performer.is_performable(action)]
+    if journal is not None and journal.done:
+        print('Skipping actions for {} items already applied according to journal'.format(len(journal.done)), file=sys.stderr)
+        actions = [action for action in actions if action.item not in journal.done]
+    batches = group_actions_by_item(actions)
+
+    scheduler = WriteScheduler(
+        performer.perform_batch,
+        wikidata.get_retry_delay,
+        workers=options.write_workers,
+        rate=options.write_rate,
+        max_rate=options.max_write_rate
+    )
+
+    completed = False
+
+    try:
+        for batch in progressify(scheduler.run(batches), 'Applying actions', total=len(batches)):
+            if journal is not None:
+                journal.record(batch[0].item)
+        completed = True
+    finally:
+        metrics.inc('edits_throttled_total', scheduler.stats.num_throttled)
+
+        # journal is only needed to resume interrupted applying
+        if journal is not None and completed:
+            journal.remove()
+        elif journal is not None:
+            journal.close()
+
+    print('Applied {} edits in {:.1f} seconds ({:.2f} edits/s), throttled {} times'.format(scheduler.stats.num_done, scheduler.stats.seconds, scheduler.stats.rate, scheduler.stats.num_throttled), file=sys.stderr)
+
+
+def run(options: argparse.Namespace) -> None:
+    wikidata: WikidataSource
+
+    if options.apply_plan:
+        print('Loading plan', file=sys.stderr)
+        with metrics.phase('load_plan'):
+            actions, source = load_plan(options.apply_plan)
+        if source != PLAN_SOURCE_API:
+            print('Not applying plan computed from Wikidata dump, which may be outdated', file=sys.stderr)
+            return
+        wikidata = WikidataApi(apiurl=options.wikidata_api)
+    else:
+        wikidata = create_wikidata_source(options)
+
+        # in low memory mode, projects are gathered lazily, so gathering
+        # time is accounted to compare phase
+        with metrics.phase('gather'):
+            item_groups = iterate_item_groups(options)
+
+        with metrics.phase('compare'):
+            actions = compute_actions(item_groups, wikidata, options)
+
+        if options.check_duplicates:
+            print('Checking added values for duplicates', file=sys.stderr)
+            with metrics.phase('check_duplicates'):
+                actions = check_duplicate_values(actions, wikidata, options)
+
+    for action_type, count in Counter(type(action).__name__ for action in actions).items():
+        metrics.set_gauge('actions', count, type=action_type)
+
+    with metrics.phase('report'):
+        reported_actions = actions
+        resolved_actions: List[Action] = []
+
+        if options.diff_against:
+            previous_actions: Iterable[Tuple[ActionKey, Action]] = []
+
+            if os.path.exists(options.diff_against):
+                previous_actions = iterate_report_index(options.diff_against)
             else:
-                for mvalue in missing:
-                    actions.append(
-                        AddPropertyAction(
-                            item=item,
-                            projectnames=projectnames,
-                            repo=mapping.repo,
-                            prop=mapping.prop,
-                            value=mvalue,
-                            url=mapping.url.format(mvalue)
-                        )
-                    )
-
-                for evalue in extra:
-                    if evalue is None:
-                        actions.append(
-                            NoValueAction(
-                                item=item,
-                                projectnames=projectnames,
-                                repo=mapping.repo,
-                                prop=mapping.prop,
-                            )
-                        )
-                    elif not mapping.ignore_missing:
-                        actions.append(
-                            RemovePropertyAction(
-                                item=item,
-                                projectnames=projectnames,
-                                repo=mapping.repo,
-                                prop=mapping.prop,
-                                value=evalue,
-                                url=mapping.url.format(evalue),
-                                histurls=[url.format(evalue) for url in mapping.histurls]
-                            )
-                        )
-
-    print('Listing actions', file=sys.stderr)
-    report = list(aggregate_report(actions))
-    format_text_report(report, options.verbose)
-
-    if options.html:
-        with open(options.html, 'w') as html:
-            html.write(format_html_report(report))
+                print('Report index {} does not exist, all actions are new'.format(options.diff_against), file=sys.stderr)
+
+            reported_actions, resolved_actions = compute_report_delta(previous_actions, actions)
+            print('{} new and {} resolved actions since previous run'.format(len(reported_actions), len(resolved_actions)), file=sys.stderr)
+
+        if options.save_report_index:
+            save_report_index(options.save_report_index, actions)
+
+        print('Listing {}actions'.format('new ' if options.diff_against else ''), file=sys.stderr)
+        report = list(aggregate_report(reported_actions))
+        format_text_report(report, options.verbose)
+
+        if resolved_actions:
+            print('Listing resolved actions', file=sys.stderr)
+            format_text_report(aggregate_report(resolved_actions), options.verbose)
+
+        if options.html and options.html_split:
+            write_paginated_html_report(report, options.html, options.html_split)
+        elif options.html:
+            with open(options.html, 'w') as html:
+                write_html_report(report, html)
+
+    if options.save_plan:
+        with metrics.phase('save_plan'):
+            save_plan(options.save_plan, actions, PLAN_SOURCE_DUMP if isinstance(wikidata, WikidataDumpIndex) else PLAN_SOURCE_API)
+        print('Saved plan with {} actions to {}, apply it with --apply-plan'.format(len(actions), options.save_plan), file=sys.stderr)
+        return
 
     if options.dry_run:
         return
 
+    if not isinstance(wikidata, WikidataApi):
+        print('Not applying changes based on Wikidata dump, which may be outdated', file=sys.stderr)
+        return
+
     if not options.yes:
         while True:
             key = input('Apply listed changes [Y/n]? ')
@@ -330,34 +649,80 @@ def run(options: argparse.Namespace) -> None:
             if key in ['n', 'N']:
                 return
 
-    performer = ActionPerformer(wikidata)
-
-    actions = [action for action in actions if performer.is_performable(action)]
-    for action in progressify(actions, 'Applying actions'):
-        performer.perform(action)
+    with metrics.phase('apply'):
+        apply_actions(actions, wikidata, options)
 
 
-def parse_arguments() -> argparse.Namespace:
+def parse_arguments(args: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--repology-api', metavar='URL', default='https://repology.org/api/v1/projects/', help='URL of Repology projects API endpoint (must end with slash)')
+    parser.add_argument('--wikidata-api', metavar='URL', default='https://www.wikidata.org/w/api.php', help='URL of Wikidata action API endpoint')
+    parser.add_argument('--prefetch-pages', metavar='N', type=int, default=1, help='number of Repology pages to fetch in background ahead of processing (0 to disable)')
+    parser.add_argument('--shards', metavar='K', type=int, default=1, help='split project name range into K shards gathered concurrently')
+    parser.add_argument('--jobs', metavar='N', type=int, default=4, help='number of shards to gather simultaneously')
+    parser.add_argument('--compare-jobs', metavar='N', type=int, default=1, help='number of processes to fetch Wikidata entities and compare items in (1 to do it in main process)')
+    parser.add_argument('--cache-dir', metavar='PATH', help='enable on-disk cache of Repology pages, specifying path to it')
+    parser.add_argument('--cache-ttl', metavar='SECONDS', type=float, default=3600, help='time after which cached Repology pages are revalidated')
+    parser.add_argument('--offline', action='store_true', help='only use cached Repology pages, never fetch them')
+    parser.add_argument('--entity-cache', metavar='PATH', help='enable persistent cache of Wikidata entities, specifying path to SQLite database')
+    parser.add_argument('--wikidata-dump', metavar='PATH', help='compare against Wikidata JSON dump (.json, .json.gz or .json.bz2) instead of querying Wikidata API')
+    parser.add_argument('--dump-index', metavar='PATH', help='path to Wikidata dump index, built from --wikidata-dump if missing or outdated (default: dump path with .index.gz suffix)')
+    parser.add_argument('--check-duplicates', action='store_true', help='before writing, flag additions of values which are already used by, or are going to be added to other items (needs --sparql-api, --entity-cache or Wikidata dump)')
+    parser.add_argument('--sparql-api', metavar='URL', help='URL of SPARQL endpoint, such as https://query.wikidata.org/sparql, to look up existing values for --check-duplicates')
+    parser.add_argument('--incremental', metavar='PATH', help='only compare items whose Repology data or Wikidata revision changed since previous run, keeping state in specified SQLite database')
+    parser.add_argument('--low-memory', action='store_true', help='spill gathered projects to disk and process items in small groups, to bound memory usage')
+    parser.add_argument('--sort-buffer', metavar='N', type=int, default=10000, help='number of records sorted in memory at once in low memory mode')
+    parser.add_argument('--timeout', metavar='SECONDS', type=float, default=60, help='timeout for Repology API requests')
+    parser.add_argument('--retries', metavar='N', type=int, default=5, help='number of times failed Repology API requests are retried')
     parser.add_argument('--from', metavar='NAME', help='minimal project name to operate on', dest='from_')
     parser.add_argument('--to', metavar='NAME', help='maximal project name to operate on')
-    parser.add_argument('--exclude', metavar='NAME', nargs='*', help='exclude specified project names or wikidata items from processing')
-    parser.add_argument('--blacklist', default='blacklist.txt', help='path to blacklist with additional excludes')
+    parser.add_argument('--exclude', metavar='NAME', nargs='*', help='exclude specified project names or wikidata items from processing (same patterns as in blacklist are allowed)')
+    parser.add_argument('--blacklist', default='blacklist.txt', help='path to blacklist with additional excludes: project names or wikidata items, prefixes (name*), globs or /regular expressions/')
     parser.add_argument('-n', '--dry-run', action='store_true', help='perform a trial run with no changes made')
     parser.add_argument('-y', '--yes', action='store_true', help='assume yes')
     parser.add_argument('-v', '--verbose', action='store_true', help='verbose mode')
     parser.add_argument('--repositories', nargs='*', help='limit operation to specifiad list of repositories (may use either repology names or wikidata properties)')
     parser.add_argument('--html', metavar='PATH', help='enable HTML output, specifying path to it')
-    parser.add_argument('--max-entries', default=50, help='skip projects with more packages than this')
+    parser.add_argument('--html-split', choices=['prefix', 'action'], help='split HTML report into pages by item id prefix or by action type, writing index into --html path')
+    parser.add_argument('--save-report-index', metavar='PATH', help='save index of reported actions, to compare next run against with --diff-against')
+    parser.add_argument('--diff-against', metavar='PATH', help='only report actions which are new or resolved since the run which saved specified report index')
+    parser.add_argument('--save-plan', metavar='PATH', help='save computed actions to a plan file instead of applying them')
+    parser.add_argument('--apply-plan', metavar='PATH', help='apply actions from a plan file instead of computing them (plans computed from Wikidata dump are refused); progress is journaled, so interrupted runs resume')
+    parser.add_argument('--write-workers', metavar='N', type=int, default=1, help='number of Wikidata edits to keep in flight')
+    parser.add_argument('--write-rate', metavar='EDITS', type=float, default=0.1, help='initial Wikidata edit rate, edits per second (adapted to server lag); default matches pywikibot put_throttle of 10 seconds')
+    parser.add_argument('--max-write-rate', metavar='EDITS', type=float, default=0.1, help='maximal Wikidata edit rate, edits per second (increase to allow speeding up when there is no lag)')
+    parser.add_argument('--metrics', metavar='PATH', help='write metrics of the run (phase timings, requests, cache hit rates, edits) to specified file')
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json', help='format of metrics file')
+    parser.add_argument('--max-entries', type=int, default=50, help='skip projects with more packages than this')
 
-    return parser.parse_args()
+    return parser.parse_args(args)
 
 
 def main() -> int:
     options = parse_arguments()
 
-    run(options)
+    if options.offline and not options.cache_dir:
+        print('--offline requires --cache-dir', file=sys.stderr)
+        return 1
+
+    if options.save_plan and options.apply_plan:
+        print('--save-plan and --apply-plan are mutually exclusive', file=sys.stderr)
+        return 1
+
+    if options.check_duplicates and not (options.sparql_api or options.entity_cache or options.wikidata_dump or options.dump_index):
+        print('--check-duplicates requires --sparql-api, --entity-cache, --wikidata-dump or --dump-index', file=sys.stderr)
+        return 1
+
+    success = False
+
+    try:
+        run(options)
+        success = True
+    finally:
+        if options.metrics:
+            metrics.set_gauge('last_run_success', int(success))
+            metrics.set_gauge('last_run_timestamp_seconds', time.time())
+            metrics.write(options.metrics, prometheus=options.metrics_format == 'prometheus')
 
     return 0
 
@@ -0,0 +1,116 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import json
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from actions import Action, AddPropertyAction, DuplicateValueAction, NoValueAction, RemovePropertyAction, TooManyValuesAction
+from actions.plan import deserialize_action, serialize_action
+
+
+_INDEX_FORMAT = 1
+
+# (item, action type, repo, prop, value)
+ActionKey = Tuple[str, str, str, str, str]
+
+
+def get_action_key(action: Action) -> ActionKey:
+    """Return key identifying an action between runs.
+
+    Details which may change without the action being different, such
+    as package count or urls, are not part of the key.
+    """
+    repo = ''
+    prop = ''
+    value = ''
+
+    if isinstance(action, (AddPropertyAction, RemovePropertyAction, NoValueAction, TooManyValuesAction, DuplicateValueAction)):
+        repo = action.repo
+        prop = action.prop
+
+    if isinstance(action, (AddPropertyAction, RemovePropertyAction, DuplicateValueAction)):
+        value = action.value
+
+    return (action.item, type(action).__name__, repo, prop, value)
+
+
+def save_report_index(path: str, actions: Iterable[Action]) -> None:
+    """Save actions sorted by key to a gzipped JSON lines file."""
+    keyed_actions = sorted(((get_action_key(action), action) for action in actions), key=lambda pair: pair[0])
+    tmp_path = path + '.tmp'
+
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as index:
+        index.write(json.dumps({'format': _INDEX_FORMAT, 'actions': len(keyed_actions)}) + '\n')
+
+        for key, action in keyed_actions:
+            index.write(json.dumps({'key': key, 'action': serialize_action(action)}, separators=(',', ':')) + '\n')
+
+    os.replace(tmp_path, path)
+
+
+def iterate_report_index(path: str) -> Iterator[Tuple[ActionKey, Action]]:
+    """Iterate (key, action) pairs from report index, in key order."""
+    with gzip.open(path, 'rt', encoding='utf-8') as index:
+        header = json.loads(next(index))
+        if header.get('format') != _INDEX_FORMAT:
+            raise RuntimeError('unsupported report index format in {}'.format(path))
+
+        prev_key: Optional[ActionKey] = None
+
+        for line in index:
+            record = json.loads(line)
+            key: ActionKey = tuple(record['key'])
+
+            if prev_key is not None and key < prev_key:
+                raise RuntimeError('report index {} is not sorted'.format(path))
+            prev_key = key
+
+            yield key, deserialize_action(record['action'])
+
+
+def compute_report_delta(previous: Iterable[Tuple[ActionKey, Action]], current: Iterable[Action]) -> Tuple[List[Action], List[Action]]:
+    """Compute new and resolved actions compared to previous run.
+
+    Previous actions are expected in key order, as stored in report
+    index. Current actions are sorted by key, after which both sequences
+    are merged in a single linear pass.
+    """
+    current_keyed = sorted(((get_action_key(action), action) for action in current), key=lambda pair: pair[0])
+
+    new: List[Action] = []
+    resolved: List[Action] = []
+
+    previous_iter = iter(previous)
+    previous_entry = next(previous_iter, None)
+
+    for key, action in current_keyed:
+        while previous_entry is not None and previous_entry[0] < key:
+            resolved.append(previous_entry[1])
+            previous_entry = next(previous_iter, None)
+
+        if previous_entry is not None and previous_entry[0] == key:
+            previous_entry = next(previous_iter, None)
+        else:
+            new.append(action)
+
+    while previous_entry is not None:
+        resolved.append(previous_entry[1])
+        previous_entry = next(previous_iter, None)
+
+    return new, resolved
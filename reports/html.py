@@ -15,15 +15,24 @@
 # You should have received a copy of the GNU General Public License
 # along with repology.  If not, see <http://www.gnu.org/licenses/>.
 
-from typing import Iterable
+import os
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
 from jinja2 import Template
 
 from reports import ReportItem
 
 
-def format_html_report(items: Iterable[ReportItem]) -> str:
-    return Template("""
+# length of item id prefix used to split report into pages, e.g. Q12
+_PAGE_PREFIX_LENGTH = 3
+
+# number of characters rendered before writing to output
+_STREAM_BUFFER_SIZE = 1000
+
+
+# compiled once, rendered with streaming
+_PAGE_TEMPLATE = Template("""
         <html>
             <head>
                 <title>Repology wikidata bot report</title>
@@ -31,7 +40,10 @@ def format_html_report(items: Iterable[ReportItem]) -> str:
             </head>
             <body>
                 <div class="container">
-                    <h1>Repology wikidata bot report</h1>
+                    <h1>Repology wikidata bot report{% if title %}: {{ title }}{% endif %}</h1>
+                    {% if index_url %}
+                    <p><a href="{{ index_url }}">Back to index</a></p>
+                    {% endif %}
                     <table class="table table-sm table-hover">
                         <thead>
                             <tr><th>Wikidata item</th><th>Repology project(s)</th><th>Action</th></tr>
@@ -62,6 +74,13 @@ def format_html_report(items: Iterable[ReportItem]) -> str:
                                     <td class="table-warning">{{ action.repo }} ({{ action.prop }}): too many ({{ action.count }}) packages in Repology, skipping</td>
                                 {% elif action.__class__.__name__ == 'MultipleItemsAction' %}
                                     <td class="table-danger">multiple wikidata items for project, skipping</td>
+                                {% elif action.__class__.__name__ == 'MissingItemAction' %}
+                                    <td class="table-danger">wikidata item does not exist or was merged, link in Repology needs fixing</td>
+                                {% elif action.__class__.__name__ == 'DuplicateValueAction' %}
+                                    <td class="table-warning">{{ action.repo }} ({{ action.prop }}):
+                                        <a href="{{ action.url }}">{{ action.value }}</a> is also used by
+                                        {% for other_item in action.other_items %}<a href="https://wikidata.org/wiki/{{ other_item }}">{{ other_item }}</a>{% if not loop.last %}, {% endif %}{% endfor %}, skipping
+                                    </td>
                                 {% else %}
                                     <td class="table-danger">unknown action</td>
                                 {% endif %}
@@ -73,4 +92,92 @@ def format_html_report(items: Iterable[ReportItem]) -> str:
                 </div>
             </body>
         </html>
-    """).render(items=items)
+""")
+
+
+_INDEX_TEMPLATE = Template("""
+        <html>
+            <head>
+                <title>Repology wikidata bot report</title>
+                <link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootstrap/4.3.1/css/bootstrap.min.css" integrity="sha384-ggOyR0iXCbMQv3Xipma34MD+dH/1fQ784/j6cY/iJTQUOhcWr7x9JvoRxT2MZw1T" crossorigin="anonymous">
+            </head>
+            <body>
+                <div class="container">
+                    <h1>Repology wikidata bot report</h1>
+                    <table class="table table-sm table-hover">
+                        <thead>
+                            <tr><th>Page</th><th>Items</th><th>Actions</th></tr>
+                        </thead>
+                        <tbody>
+                        {% for page in pages %}
+                            <tr>
+                                <td><a href="{{ page.url }}">{{ page.title }}</a></td>
+                                <td>{{ page.num_items }}</td>
+                                <td>{{ page.num_actions }}</td>
+                            </tr>
+                        {% endfor %}
+                        </tbody>
+                    </table>
+                </div>
+            </body>
+        </html>
+    """)
+
+
+def write_html_report(items: Iterable[ReportItem], output: TextIO, title: Optional[str] = None, index_url: Optional[str] = None) -> None:
+    """Render HTML report into output incrementally, without building it in memory."""
+    stream = _PAGE_TEMPLATE.stream(items=items, title=title, index_url=index_url)
+    stream.enable_buffering(_STREAM_BUFFER_SIZE)
+    stream.dump(output)
+
+
+def _iterate_pages_by_prefix(items: Iterable[ReportItem]) -> Iterator[Tuple[str, Iterable[ReportItem]]]:
+    # report is sorted by item, so items with common prefix are adjacent
+    yield from groupby(items, key=lambda item: item.item[:_PAGE_PREFIX_LENGTH])
+
+
+def _iterate_pages_by_action(items: List[ReportItem]) -> Iterator[Tuple[str, Iterable[ReportItem]]]:
+    def filter_items(action_type: str) -> Iterator[ReportItem]:
+        for item in items:
+            actions = [action for action in item.actions if type(action).__name__ == action_type]
+            if actions:
+                yield ReportItem(item.item, item.projectnames, actions)
+
+    for action_type in sorted(set(type(action).__name__ for item in items for action in item.actions)):
+        yield action_type, filter_items(action_type)
+
+
+def write_paginated_html_report(items: List[ReportItem], path: str, split_by: str = 'prefix') -> None:
+    """Render HTML report as a set of pages with an index.
+
+    Report is split either by item id prefix or by action type. Index
+    is written into path, and pages are placed next to it, with page
+    keys appended to the file name. Pages are rendered one by one
+    with streaming.
+    """
+    base, ext = os.path.splitext(path)
+    index_url = os.path.basename(path)
+
+    pages: List[Dict[str, object]] = []
+    counts = {'items': 0, 'actions': 0}
+
+    def count(items: Iterable[ReportItem]) -> Iterator[ReportItem]:
+        for item in items:
+            counts['items'] += 1
+            counts['actions'] += len(item.actions)
+            yield item
+
+    iterate_pages = _iterate_pages_by_action if split_by == 'action' else _iterate_pages_by_prefix
+
+    for key, page_items in iterate_pages(items):
+        page_path = '{}-{}{}'.format(base, key, ext)
+        counts['items'] = counts['actions'] = 0
+
+        with open(page_path, 'w') as output:
+            write_html_report(count(page_items), output, title=key, index_url=index_url)
+
+        pages.append({'title': key, 'url': os.path.basename(page_path), 'num_items': counts['items'], 'num_actions': counts['actions']})
+
+    with open(path, 'w') as output:
+        stream = _INDEX_TEMPLATE.stream(pages=pages)
+        stream.dump(output)
@@ -19,7 +19,7 @@ import sys
 from typing import Iterable
 from urllib.parse import quote
 
-from actions import AddPropertyAction, MultipleItemsAction, NoValueAction, RemovePropertyAction, TooManyValuesAction
+from actions import AddPropertyAction, DuplicateValueAction, MissingItemAction, MultipleItemsAction, NoValueAction, RemovePropertyAction, TooManyValuesAction
 
 from reports import ReportItem
 
@@ -87,5 +87,10 @@ def format_text_report(items: Iterable[ReportItem], verbose: bool = False) -> No
                 print_item(_Colors.skipped('too many ({}) packages in Repology, skipping'.format(action.count)))
             elif isinstance(action, MultipleItemsAction):
                 print_item(_Colors.skipped('multiple wikidata items for project, skipping'))
+            elif isinstance(action, MissingItemAction):
+                print_item(_Colors.remove('wikidata item does not exist or was merged') + ', link in Repology needs fixing')
+            elif isinstance(action, DuplicateValueAction):
+                itemstr = item_url(_Colors.skipped(action.value), _Colors.url(action.url))
+                print_item(itemstr + _Colors.skipped(' is also used by {}, skipping'.format(', '.join(action.other_items))))
             else:
                 assert(False)
@@ -0,0 +1,46 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import unittest
+from operator import itemgetter
+
+from apis.repology import RepologyProject
+
+from utils.extsort import external_sort
+
+
+class TestExternalSort(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        rng = random.Random(1)
+        records = []
+
+        for num in range(50):
+            item = 'Q{}'.format(rng.randrange(20))
+            # item string is shared with the project, as in real data
+            records.append((item, RepologyProject('project{}'.format(num), {('wikidata', 'name'): (item,), ('gentoo', 'srcname'): ('cat/{}'.format(num),)})))
+
+        self.assertEqual(list(external_sort(records, key=itemgetter(0), run_size=7)), sorted(records, key=itemgetter(0)))
+
+    def test_no_spill(self) -> None:
+        records = [(3, 'c'), (1, 'a'), (2, 'b'), (1, 'd')]
+
+        self.assertEqual(list(external_sort(records, key=itemgetter(0))), sorted(records, key=itemgetter(0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from utils.namematcher import NameMatcher
+
+
+class TestNameMatcher(unittest.TestCase):
+    def test_patterns(self) -> None:
+        matcher = NameMatcher(['foo', 'python:*', '*-doc', 'lib?', 'fonts-[ab]*', '/x[0-9]+/'])
+
+        for name in ['foo', 'python:', 'python:foo', '-doc', 'bar-doc', 'libc', 'fonts-a', 'fonts-bar', 'x12']:
+            self.assertIn(name, matcher)
+
+        for name in ['fo', 'food', 'python', 'doc', 'bar-docs', 'lib', 'libcc', 'fonts-c', 'x', 'x12y']:
+            self.assertNotIn(name, matcher)
+
+    def test_regex_groups(self) -> None:
+        # group numbers and names must not clash between patterns
+        matcher = NameMatcher([r'/(a)b\1/', r'/(c)\1/', '/(?P<x>d)/', '/(?P<x>e)/', '/f+/'])
+
+        for name in ['aba', 'cc', 'd', 'e', 'fff']:
+            self.assertIn(name, matcher)
+
+        for name in ['abc', 'c', 'dd', 'g']:
+            self.assertNotIn(name, matcher)
+
+    def test_bad_regex(self) -> None:
+        with self.assertRaises(RuntimeError):
+            NameMatcher(['/(/'])
+
+        with self.assertRaises(RuntimeError):
+            NameMatcher(['/(?i)foo/'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+from typing import List
+
+from apis.wikidump import WikidataDumpIndex, _iterate_dump_entities, open_dump_index
+
+
+_DUMP_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'dump.json.gz')
+
+_PROPS = ['P3499', 'P7427']
+
+
+class TestWikidataDump(unittest.TestCase):
+    def test_iterate_dump_entities(self) -> None:
+        self.assertEqual([entity['id'] for entity in _iterate_dump_entities(_DUMP_PATH, _PROPS)], ['Q1', 'Q3'])
+        self.assertEqual([entity['id'] for entity in _iterate_dump_entities(_DUMP_PATH, ['P7427'])], ['Q3'])
+        self.assertEqual([entity['id'] for entity in _iterate_dump_entities(_DUMP_PATH, ['P1'])], [])
+
+    def test_from_dump(self) -> None:
+        index = WikidataDumpIndex.from_dump(_DUMP_PATH, _PROPS)
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.props, _PROPS)
+        self.assertEqual(index.modified, '2020-02-01T00:00:00Z')
+        self.assertEqual(index.get_revisions(['Q1', 'Q2', 'Q3']), {'Q1': 101, 'Q2': 0, 'Q3': 103})
+
+        self.assertEqual(index.get_values('Q1', 'P3499'), {'dev-lang/foo'})
+        self.assertEqual(index.get_values('Q1', 'P3499', allow_deprecated=True), {'dev-lang/foo', 'dev-lang/foo-old', 'dev-lang/foo-legacy'})
+        self.assertEqual(index.get_values('Q3', 'P3499'), {None})
+        self.assertEqual(index.get_values('Q3', 'P7427'), {'devel/bar'})
+        self.assertEqual(index.get_values('Q2', 'P3499'), set())
+
+    def test_save_load(self) -> None:
+        index = WikidataDumpIndex.from_dump(_DUMP_PATH, _PROPS)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'index.gz')
+            index.save(path)
+            loaded = WikidataDumpIndex.load(path)
+
+        self.assertEqual(loaded.props, index.props)
+        self.assertEqual(loaded.modified, index.modified)
+        self.assertEqual(dict(loaded.iterate_entities()), dict(index.iterate_entities()))
+        self.assertEqual(loaded.get_revisions(['Q1', 'Q3']), index.get_revisions(['Q1', 'Q3']))
+
+
+class TestOpenDumpIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self._tmpdir.name, 'index.gz')
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def save_stub_index(self, props: List[str], age: float) -> None:
+        # empty index, which may only be returned if not rebuilt
+        WikidataDumpIndex(props).save(self.index_path)
+        mtime = os.path.getmtime(_DUMP_PATH) - age
+        os.utime(self.index_path, (mtime, mtime))
+
+    def test_build(self) -> None:
+        self.assertEqual(len(open_dump_index(_DUMP_PATH, self.index_path, _PROPS)), 2)
+        self.assertEqual(len(WikidataDumpIndex.load(self.index_path)), 2)
+
+    def test_reuse(self) -> None:
+        self.save_stub_index(_PROPS, -10)
+        self.assertEqual(len(open_dump_index(_DUMP_PATH, self.index_path, _PROPS)), 0)
+
+    def test_reuse_wider(self) -> None:
+        self.save_stub_index(_PROPS + ['P1'], -10)
+        self.assertEqual(len(open_dump_index(_DUMP_PATH, self.index_path, _PROPS)), 0)
+
+    def test_rebuild_outdated(self) -> None:
+        self.save_stub_index(_PROPS, 10)
+        self.assertEqual(len(open_dump_index(_DUMP_PATH, self.index_path, _PROPS)), 2)
+
+    def test_rebuild_narrower(self) -> None:
+        self.save_stub_index(['P3499'], -10)
+        self.assertEqual(len(open_dump_index(_DUMP_PATH, self.index_path, _PROPS)), 2)
+
+    def test_no_dump(self) -> None:
+        with self.assertRaises(RuntimeError):
+            open_dump_index(None, self.index_path, _PROPS)
+
+        # without a dump, existing index is used as is
+        self.save_stub_index(['P3499'], 10)
+        self.assertEqual(len(open_dump_index(None, self.index_path, _PROPS)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
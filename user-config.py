@@ -4,4 +4,10 @@ usernames['wikidata']['wikidata'] = 'Repology_bot'
 noisysleep = 999999.0
 maxlag = 5
 socket_timeout = (5, 120)
-max_retries = 99999
+# pywikibot is only used for writes; this limits its retries on both
+# maxlag and network or server errors, after which the error is passed
+# to the bot's write scheduler, which slows down and pauses all writers
+# and retries the edit indefinitely
+max_retries = 3
+# edit rate is controlled by the bot itself
+put_throttle = 0
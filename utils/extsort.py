@@ -0,0 +1,78 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import heapq
+import pickle
+import struct
+import tempfile
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, TypeVar
+
+
+T = TypeVar('T')
+
+
+# length prefix of each pickled record
+_LENGTH = struct.Struct('<I')
+
+
+def _write_run(records: List[T], tmpdir: Optional[str]) -> BinaryIO:
+    run = tempfile.TemporaryFile(dir=tmpdir)
+
+    # records are pickled independently, so no memo is shared between
+    # them, and each one may be read back on its own
+    for record in records:
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        run.write(_LENGTH.pack(len(data)))
+        run.write(data)
+
+    run.seek(0)
+    return run
+
+
+def _read_run(run: BinaryIO) -> Iterator[Any]:
+    while True:
+        header = run.read(_LENGTH.size)
+        if not header:
+            run.close()
+            return
+
+        yield pickle.loads(run.read(_LENGTH.unpack(header)[0]))
+
+
+def external_sort(records: Iterable[T], key: Callable[[T], Any], run_size: int = 10000, tmpdir: Optional[str] = None) -> Iterator[T]:
+    """Sort records using bounded amount of memory.
+
+    Records are collected in runs of run_size, which are sorted and
+    spilled to temporary files, and then lazily merged. Only one run
+    is held in memory at a time while spilling, and only one record
+    per run while merging. The sort is stable.
+    """
+    runs: List[BinaryIO] = []
+    records_buffer: List[T] = []
+
+    for record in records:
+        records_buffer.append(record)
+
+        if len(records_buffer) >= run_size:
+            records_buffer.sort(key=key)
+            runs.append(_write_run(records_buffer, tmpdir))
+            records_buffer = []
+
+    records_buffer.sort(key=key)
+
+    # stability is preserved as heapq.merge prefers earlier iterables on ties
+    yield from heapq.merge(*(_read_run(run) for run in runs), records_buffer, key=key)
@@ -0,0 +1,129 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import codecs
+import json
+import re
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+_decoder = json.JSONDecoder()
+
+
+class _StreamReader:
+    _chunks: Iterator[bytes]
+    _decoder: codecs.IncrementalDecoder
+    _buffer: str
+    _pos: int
+    _eof: bool
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+
+        # drop already consumed data
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self._buffer += text
+                return True
+
+        self._buffer += self._decoder.decode(b'', final=True)
+        self._eof = True
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()  # type: ignore
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('malformed JSON stream: expected one of {!r}, got {!r}'.format(chars, char))
+        self._pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+                # a number at the end of the buffer may be incomplete
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+
+            self._fill()
+
+
+def iterate_json_object(chunks: Iterable[bytes], element_filter: Optional[Callable[[Any], bool]] = None) -> Iterator[Tuple[str, Any]]:
+    """Incrementally decode top level JSON object from a stream of chunks.
+
+    Key/value pairs are yielded as soon as each one is complete. If
+    element_filter is specified, values are expected to be arrays, and
+    their elements are decoded one by one, dropping ones for which the
+    filter returns false, so these are never accumulated.
+    """
+    reader = _StreamReader(chunks)
+
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        key = reader.value()
+        reader.expect(':')
+
+        if element_filter is None:
+            value = reader.value()
+        else:
+            value = []
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    element = reader.value()
+                    if element_filter(element):
+                        value.append(element)
+                    if reader.expect(',]') == ']':
+                        break
+
+        yield key, value
+
+        if reader.expect(',}') == '}':
+            return
@@ -0,0 +1,212 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+_PREFIX = 'repology_wikidata_bot_'
+
+# upper bounds of latency histogram buckets, in seconds
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_Labels = Tuple[Tuple[str, str], ...]
+_Key = Tuple[str, _Labels]
+
+
+class Histogram:
+    buckets: Tuple[float, ...]
+    counts: List[int]
+    total: float
+    count: int
+
+    def __init__(self, buckets: Tuple[float, ...] = _LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[Tuple[str, int]]:
+        """Return (upper bound, count of values not exceeding it) pairs, as in Prometheus."""
+        result = []
+        total = 0
+
+        for bound, count in zip(list(map(repr, self.buckets)) + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels) + '}'
+
+
+class Metrics:
+    """Thread safe registry of counters, gauges, histograms and phase timings.
+
+    Metrics are identified by name and a set of labels, and may be
+    exported as JSON or in Prometheus text format, the latter suitable
+    for node_exporter textfile collector.
+    """
+
+    _lock: threading.Lock
+    _phases: Dict[str, float]
+    _counters: Dict[_Key, float]
+    _gauges: Dict[_Key, float]
+    _histograms: Dict[_Key, Histogram]
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._phases = {}
+            self._counters = {}
+            self._gauges = {}
+            self._histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Account wall time spent in a block to named phase."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._phases[name] = self._phases.get(name, 0.0) + time.monotonic() - start
+
+    def get_cache_hit_rates(self) -> Dict[str, float]:
+        """Compute hit rates from cache_requests_total counters, by cache."""
+        hits: Dict[str, float] = {}
+        totals: Dict[str, float] = {}
+
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                if name == 'cache_requests_total':
+                    labels_dict = dict(labels)
+                    cache = labels_dict.get('cache', '')
+                    totals[cache] = totals.get(cache, 0) + value
+                    if labels_dict.get('result') == 'hit':
+                        hits[cache] = hits.get(cache, 0) + value
+
+        return {cache: hits.get(cache, 0) / total for cache, total in totals.items() if total}
+
+    def as_dict(self) -> Dict[str, Any]:
+        hit_rates = self.get_cache_hit_rates()
+
+        with self._lock:
+            return {
+                'phases': dict(self._phases),
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self._counters.items())],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self._gauges.items())],
+                'histograms': [
+                    {
+                        'name': name,
+                        'labels': dict(labels),
+                        'buckets': dict(histogram.cumulative_counts()),
+                        'sum': histogram.total,
+                        'count': histogram.count,
+                    }
+                    for (name, labels), histogram in sorted(self._histograms.items())
+                ],
+                'cache_hit_rates': hit_rates,
+            }
+
+    def format_prometheus(self) -> str:
+        lines: List[str] = []
+        typed = set()
+
+        def add(name: str, kind: str, labels: _Labels, value: float) -> None:
+            if name not in typed:
+                lines.append('# TYPE {}{} {}'.format(_PREFIX, name, kind))
+                typed.add(name)
+            lines.append('{}{}{} {}'.format(_PREFIX, name, _format_labels(labels), repr(float(value))))
+
+        hit_rates = self.get_cache_hit_rates()
+
+        with self._lock:
+            for phase, seconds in self._phases.items():
+                add('phase_seconds', 'gauge', (('phase', phase),), seconds)
+
+            for (name, labels), value in sorted(self._counters.items()):
+                add(name, 'counter', labels, value)
+
+            for (name, labels), value in sorted(self._gauges.items()):
+                add(name, 'gauge', labels, value)
+
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append('# TYPE {}{} histogram'.format(_PREFIX, name))
+                    typed.add(name)
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('{}{}_bucket{} {}'.format(_PREFIX, name, _format_labels(labels + (('le', bound),)), count))
+                lines.append('{}{}_sum{} {}'.format(_PREFIX, name, _format_labels(labels), repr(histogram.total)))
+                lines.append('{}{}_count{} {}'.format(_PREFIX, name, _format_labels(labels), histogram.count))
+
+        for cache, rate in sorted(hit_rates.items()):
+            add('cache_hit_ratio', 'gauge', (('cache', cache),), rate)
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str, prometheus: bool = False) -> None:
+        """Write metrics as JSON or in Prometheus format to a file.
+
+        The file is replaced atomically, so readers never see it incomplete.
+        """
+        if prometheus:
+            data = self.format_prometheus()
+        else:
+            data = json.dumps(self.as_dict(), indent=2, sort_keys=True) + '\n'
+
+        with open(path + '.tmp', 'w') as fd:
+            fd.write(data)
+        os.replace(path + '.tmp', path)
+
+
+# registry used by the whole bot
+metrics = Metrics()
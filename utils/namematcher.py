@@ -0,0 +1,114 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import fnmatch
+import re
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Set
+
+
+# marks end of a prefix in trie
+_TRIE_END = ''
+
+
+def _add_to_trie(trie: Dict[str, Any], key: str) -> None:
+    node = trie
+    for char in key:
+        node = node.setdefault(char, {})
+    node[_TRIE_END] = True
+
+
+def _match_trie(trie: Dict[str, Any], name: Iterable[str]) -> bool:
+    """Check whether any of keys in trie is a prefix of name."""
+    node = trie
+    for char in name:
+        if _TRIE_END in node:
+            return True
+        next_node = node.get(char)
+        if next_node is None:
+            return False
+        node = next_node
+    return _TRIE_END in node
+
+
+class NameMatcher:
+    """Matches names against a list of patterns.
+
+    A pattern may be an exact name, a prefix (name*), a suffix (*name),
+    a glob (with *, ? or [...] anywhere) or a regular expression
+    (/regex/) which should match the whole name. Patterns are compiled
+    once into an exact name set, prefix and suffix tries and a single
+    combined regex, so the cost of matching a name mostly depends on
+    its length rather than on the number of patterns. Regexes with
+    groups can't be combined (group numbers and names would clash), so
+    these are compiled and matched separately.
+    """
+
+    _exact: Set[str]
+    _prefixes: Dict[str, Any]
+    _suffixes: Dict[str, Any]
+    _regex: Optional[Pattern[str]]
+    _separate_regexes: List[Pattern[str]]
+
+    def __init__(self, patterns: Iterable[str] = ()) -> None:
+        self._exact = set()
+        self._prefixes = {}
+        self._suffixes = {}
+        self._separate_regexes = []
+
+        regexes: List[str] = []
+
+        for pattern in patterns:
+            if len(pattern) > 2 and pattern.startswith('/') and pattern.endswith('/'):
+                regex = r'(?:{})\Z'.format(pattern[1:-1])
+                try:
+                    # check it as a part of combined regex, where e.g.
+                    # global inline flags are not allowed
+                    compiled = re.compile('(?:)|' + regex)
+                except re.error as e:
+                    raise RuntimeError('bad regular expression in pattern {}: {}'.format(pattern, e.msg))
+                if compiled.groups:
+                    self._separate_regexes.append(re.compile(regex))
+                else:
+                    regexes.append(regex)
+            elif not any(char in pattern for char in '*?['):
+                self._exact.add(pattern)
+            elif pattern.endswith('*') and not any(char in pattern[:-1] for char in '*?['):
+                _add_to_trie(self._prefixes, pattern[:-1])
+            elif pattern.startswith('*') and not any(char in pattern[1:] for char in '*?['):
+                _add_to_trie(self._suffixes, pattern[:0:-1])
+            else:
+                regexes.append(fnmatch.translate(pattern))
+
+        self._regex = re.compile('|'.join('(?:{})'.format(regex) for regex in regexes)) if regexes else None
+
+    def __contains__(self, name: object) -> bool:
+        if not isinstance(name, str):
+            return False
+
+        if name in self._exact:
+            return True
+
+        if self._prefixes and _match_trie(self._prefixes, name):
+            return True
+
+        if self._suffixes and _match_trie(self._suffixes, reversed(name)):
+            return True
+
+        if self._regex is not None and self._regex.match(name) is not None:
+            return True
+
+        return any(regex.match(name) is not None for regex in self._separate_regexes)
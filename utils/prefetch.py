@@ -0,0 +1,116 @@
+# Copyright (C) 2019 Dmitry Marakasov <amdmi3@amdmi3.ru>
+#
+# This file is part of repology-wikidata-bot
+#
+# repology is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# repology is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with repology.  If not, see <http://www.gnu.org/licenses/>.
+
+import queue
+import threading
+from typing import Any, Generic, Iterable, Iterator, Optional, Tuple, TypeVar
+
+
+T = TypeVar('T')
+
+_END = object()
+
+
+class _Prefetcher(Generic[T]):
+    """Iterates iterable in a background thread, keeping up to depth values ready."""
+
+    _iterable: Iterable[T]
+    _entries: 'queue.Queue[Tuple[Any, Optional[BaseException]]]'
+    _stop: threading.Event
+    _thread: threading.Thread
+
+    def __init__(self, iterable: Iterable[T], depth: int) -> None:
+        self._iterable = iterable
+        self._entries = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+
+    def _put(self, entry: Tuple[Any, Optional[BaseException]]) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._entries.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _worker(self) -> None:
+        try:
+            for value in self._iterable:
+                if not self._put((value, None)):
+                    return
+        except BaseException as e:
+            self._put((_END, e))
+        else:
+            self._put((_END, None))
+
+    def start(self) -> None:
+        if self._thread.ident is None:
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def iterate(self) -> Iterator[T]:
+        self.start()
+
+        while True:
+            value, error = self._entries.get()
+            if value is _END:
+                if error is not None:
+                    raise error
+                return
+            yield value
+
+
+def prefetchify(iterable: Iterable[T], depth: int = 1) -> Iterator[T]:
+    """Iterate iterable in a background thread, keeping up to depth values ready.
+
+    Values are yielded in the original order, and an exception raised
+    by the source iterable is reraised to the consumer. When the
+    consumer stops early, the background thread is stopped as well.
+    """
+    if depth <= 0:
+        yield from iterable
+        return
+
+    prefetcher = _Prefetcher(iterable, depth)
+
+    try:
+        yield from prefetcher.iterate()
+    finally:
+        prefetcher.stop()
+
+
+def chain_prefetched(iterables: Iterable[Iterable[T]], depth: int = 1, jobs: int = 1) -> Iterator[T]:
+    """Iterate iterables one after another, prefetching up to jobs of them concurrently.
+
+    Each iterable, starting from the current one, is iterated in its
+    own background thread, keeping up to depth values ready, so memory
+    usage is bounded unlike when the iterables are gathered as a whole.
+    """
+    prefetchers = [_Prefetcher(iterable, max(depth, 1)) for iterable in iterables]
+
+    try:
+        for index, prefetcher in enumerate(prefetchers):
+            for ahead in prefetchers[index:index + max(jobs, 1)]:
+                ahead.start()
+
+            yield from prefetcher.iterate()
+    finally:
+        for prefetcher in prefetchers:
+            prefetcher.stop()
@@ -18,11 +18,11 @@
 import sys
 import time
 from datetime import timedelta
-from typing import Any, Iterable
+from typing import Any, Iterable, Optional
 
 
-def progressify(iterable: Any, message: str) -> Iterable[Any]:
-    num_total = len(iterable) if hasattr(iterable, '__len__') else None
+def progressify(iterable: Any, message: str, total: Optional[int] = None) -> Iterable[Any]:
+    num_total = len(iterable) if hasattr(iterable, '__len__') else total
     num_done = 0
     it = iter(iterable)
     start_time = time.monotonic()